@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import argparse
+import textwrap
+import concurrent.futures
+
+import numpy as np
+
+from lib.Analysis import Summary, Capture, select_channels, analyze
+
+#---------------------------------------------------------
+# Configuration
+#---------------------------------------------------------
+
+THRESHOLD = -90
+PERCENTILES = (50, 90, 99)
+
+# 868MHz band sub-bands checked by default: name, start and stop (MHz)
+# and duty cycle limit (%)
+CHANNELS = (
+    ("g", 863.0, 868.0, 1.0),
+    ("g1", 868.0, 868.6, 1.0),
+    ("g2", 868.7, 869.2, 0.1),
+    ("g3", 869.4, 869.65, 10.0),
+    ("g4", 869.7, 870.0, 1.0),
+)
+
+#---------------------------------------------------------
+# Command line arguments
+#---------------------------------------------------------
+
+def arguments():
+
+    epilog = """
+Usage examples:
+
+Occupancy, peak hold and percentiles of every frequency and hourly duty cycle of the 868MHz sub-bands
+    python {0} capture.csv
+
+A month of daily captures from rfexplorer.py (swipe mode CSV or recordings) on 8 cores, -80dBm being busy
+    python {0} -j 8 -k -80 2024-05-*.rftr
+
+Duty cycle of two given channels in a month of captures taken with --utc, reports written to month.spectrum.csv and month.duty.csv
+    python {0} -c 868.0:868.6:1 -c 869.4:869.65:10 -o month 2024-05-*.csv
+
+(c) 2019-2024 Xose Pérez (@xoseperez)""".format(sys.argv[0])
+
+    # Parse command line options
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, epilog=textwrap.dedent(epilog))
+    parser.add_argument("filenames", nargs='+', help="recordings or CSV captures (swipe mode of rfexplorer.py, peak mode of pm8000.py, convert.py), all of the same frequencies")
+    parser.add_argument("-k", dest="threshold", type=float, help="a step over this level (dBm) is occupied", default=THRESHOLD)
+    parser.add_argument("-c", dest="channels", help="channel for the duty cycle as start:stop[:limit] in MHz and % (can be repeated), otherwise the 868MHz sub-bands", action='append', default=None)
+    parser.add_argument("-q", dest="percentiles", type=float, help="percentile spectrum to report (can be repeated)", action='append', default=None)
+    parser.add_argument("-j", dest="jobs", type=int, help="worker processes", default=os.cpu_count())
+    parser.add_argument("-o", dest="prefix", help="write the reports to PREFIX.spectrum.csv and PREFIX.duty.csv instead of stdout", default=None)
+    return parser.parse_args()
+
+#---------------------------------------------------------
+# Helper methods
+#---------------------------------------------------------
+
+def channel(text):
+    """
+    Parses a start:stop[:limit] channel
+    """
+    fields = [float(field) for field in text.split(":")]
+    if len(fields) not in (2, 3) or fields[1] < fields[0]:
+        raise ValueError("Invalid channel '{0}', use start:stop[:limit]".format(text))
+    return ("{0:g}-{1:g}".format(fields[0], fields[1]), fields[0], fields[1], fields[2] if len(fields) == 3 else None)
+
+def hour_name(hour, epoch):
+    if epoch:
+        return time.strftime("%Y-%m-%dT%H:00Z", time.gmtime(hour * 3600))
+    return "{0}h".format(hour)
+
+def spectrum(summary, frequencies, percentiles, output):
+    """
+    Occupancy (%), peak hold and percentiles (dBm) of every step
+    """
+    output.write("frequency,occupancy,peak," + ",".join("p{0:g}".format(q) for q in percentiles) + "\n")
+    columns = [summary.occupancy(), summary.peak] + [summary.percentile(q) for q in percentiles]
+    format = "{:.3f},{:.3f}" + ",{:.1f}" * (len(columns) - 1) + "\n"
+    for row in zip(frequencies.tolist(), *[column.tolist() for column in columns]):
+        output.write(format.format(*row))
+
+def duty(summary, output):
+    """
+    Sweeps and duty cycle (%) of every channel per hour
+    """
+    output.write("hour,sweeps," + ",".join(name for name, first, last, limit in summary.channels) + "\n")
+    for hour, sweeps, cycles in summary.duty():
+        output.write("{0},{1},".format(hour_name(hour, summary.epoch), sweeps) + ",".join("{0:.3f}".format(cycle) for cycle in cycles.tolist()) + "\n")
+
+def compliance(summary, frequencies):
+    """
+    Worst hour of every channel against its duty cycle limit
+    """
+    hours = summary.duty()
+    for index, (name, first, last, limit) in enumerate(summary.channels):
+        line = name
+        if not np.isnan(frequencies[first]):
+            line += ": {0:.2f}-{1:.2f}MHz".format(frequencies[first], frequencies[last - 1])
+        if hours:
+            worst = max(hours, key=lambda entry: entry[2][index])
+            line += ", max {0:.3f}% at {1}".format(worst[2][index], hour_name(worst[0], summary.epoch))
+            if limit is not None:
+                over = len([entry for entry in hours if entry[2][index] > limit])
+                line += ", limit {0:g}%".format(limit) + (", over in {0} hours".format(over) if over else "")
+        print(line, file=sys.stderr)
+
+#---------------------------------------------------------
+# Main
+#---------------------------------------------------------
+
+# Worker processes import this file too on platforms that spawn them
+if __name__ == "__main__":
+
+    try:
+
+        # Parse arguments
+        args = arguments()
+        percentiles = args.percentiles or PERCENTILES
+
+        captures = [Capture(filename) for filename in args.filenames]
+        frequencies = captures[0].frequencies
+        for capture in captures[1:]:
+            if capture.frequencies.shape != frequencies.shape or not np.allclose(capture.frequencies, frequencies, equal_nan=True):
+                raise ValueError("{0} does not have the frequencies of {1}".format(capture.filename, captures[0].filename))
+
+        # Hours since the start of different files would be added together
+        relative = [capture.filename for capture in captures if capture.relative]
+        if relative and len(captures) > 1:
+            raise ValueError("{0} has no UTC timestamps, analyze it alone or use recordings or captures taken with --utc".format(relative[0]))
+
+        bands = [channel(text) for text in args.channels] if args.channels else CHANNELS
+        channels = select_channels(frequencies, bands)
+        tasks = sum([capture.tasks(args.threshold, channels) for capture in captures], [])
+
+        # Tasks are summarized by the worker processes and merged into one
+        start = time.time()
+        summary = Summary(len(frequencies), args.threshold, channels)
+        if args.jobs > 1 and len(tasks) > 1:
+            with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+                for result in executor.map(analyze, tasks):
+                    summary.merge(result)
+        else:
+            for task in tasks:
+                summary.merge(analyze(task))
+        elapsed = max(time.time() - start, 1e-6)
+
+        if args.prefix:
+            with open(args.prefix + ".spectrum.csv", "w") as output:
+                spectrum(summary, frequencies, percentiles, output)
+            with open(args.prefix + ".duty.csv", "w") as output:
+                duty(summary, output)
+        else:
+            spectrum(summary, frequencies, percentiles, sys.stdout)
+            print()
+            duty(summary, sys.stdout)
+
+        size = sum(capture.size for capture in captures)
+        print("{0} sweeps of {1} steps, {2} skipped, {3:.1f} hours".format(summary.sweeps, len(frequencies), summary.skipped,
+            max(summary.last - summary.first, 0) / 3600), file=sys.stderr)
+        print("{0:.1f}MB in {1:.1f}s, {2:.1f}MB/s with {3} jobs".format(size / 1e6, elapsed, size / 1e6 / elapsed, args.jobs), file=sys.stderr)
+        compliance(summary, frequencies)
+
+    except KeyboardInterrupt:
+        None
+
+    except BrokenPipeError:
+        None
+
+    except Exception as obEx:
+        print("Error: " + str(obEx))
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import time
+import bisect
+import socket
+import argparse
+import tempfile
+import textwrap
+import threading
+import subprocess
+
+import numpy as np
+
+from lib.Simulator import RFExplorerSimulator, PM8000Simulator, MARKER_CODES, marker_code
+from lib.Recording import RecordingReader, RecordingWriter, row_dtype
+from lib.Output import SINKS
+
+#---------------------------------------------------------
+# Configuration
+#---------------------------------------------------------
+
+DURATION = 10
+RFEXPLORER_STEPS = 112
+RFEXPLORER_RATE = 10
+PM8000_RATE = 8
+SAMPLE_INTERVAL = 0.2
+WARMUP = 2
+SERVER_PORT = 52000
+SLOW_EVERY = 5
+SLOW_DELAY = 0.5
+CONNECT_TIMEOUT = 10
+STARTUP_DURATION = 2
+
+RFEXPLORER_MODES = ['peak', 'swipe', 'plot', 'waterfall', 'record']
+PM8000_MODES = ['peak', 'plot', 'record']
+
+# Column of the marker amplitude in the CSV rows of each script
+MARKER_COLUMN = { 'rfexplorer.py': { 'peak': 2, 'swipe': 1 }, 'pm8000.py': { 'peak': 1 } }
+
+# Synthetic captures for analyze.py: 863-870MHz sweeps every SYNTHETIC_INTERVAL
+# seconds with the simulator carriers and a burst in SYNTHETIC_BUSY of them,
+# written SYNTHETIC_BLOCK rows at a time from a pool of SYNTHETIC_POOL rows
+SYNTHETIC_INTERVAL = 0.1
+SYNTHETIC_BUSY = 0.02
+SYNTHETIC_BLOCK = 10000
+SYNTHETIC_POOL = 4096
+
+# Messages of the RF Explorer library found in swipe mode captures, before
+# the header and, after every retune, between the rows
+SYNTHETIC_PREAMBLE = [
+    "User COM port: /dev/ttyUSB0",
+    "Connected: /dev/ttyUSB0, 500000 bauds",
+    "Received RF Explorer device model info:#C2-M:003,255,01.28",
+    "New Freq range - buffer cleared.",
+    "Frequency center: 866.5MHz start: 863.0MHz stop: 870.0MHz span: 7.0MHz",
+    "Device serial number: 0123456789ABCDEF",
+]
+SYNTHETIC_RETUNE = "New Freq range - buffer cleared."
+
+#---------------------------------------------------------
+# Command line arguments
+#---------------------------------------------------------
+
+def arguments():
+
+    epilog = """
+Usage examples:
+
+Benchmark every output mode of rfexplorer.py and pm8000.py for 10 seconds each
+    python {0}
+
+Benchmark the RF Explorer text modes with 4096 step sweeps at 50 sweeps/s
+    python {0} -s rfexplorer -m peak -m swipe -n 4096 -r 50
+
+Load test the server mode of rfexplorer.py with 50 clients, one in five reading slowly
+    python {0} -s rfexplorer -c 50 -r 50
+
+Benchmark analyze.py on 4GB CSV and recording captures with 1, 2 and 4 worker processes
+    python {0} -g 4 -j 1 -j 2 -j 4
+
+Import time, peak memory and time to the first sample of every mode
+    python {0} -S
+
+CPU per sweep before and after a change, running the scripts of an older checkout too
+    git worktree add /tmp/before HEAD~1
+    python {0} -s rfexplorer -m peak -t /tmp/before
+    python {0} -s rfexplorer -m peak
+
+Size and write speed of 100000 sweeps of 112 steps as recordings and as CSV (swipe mode)
+    python {0} -w 100000
+
+(c) 2019-2024 Xose Pérez (@xoseperez)""".format(sys.argv[0])
+
+    # Parse command line options
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, epilog=textwrap.dedent(epilog))
+    parser.add_argument("-s", dest="scripts", help="script to benchmark (can be repeated)", choices=['rfexplorer', 'pm8000'], action='append', default=None)
+    parser.add_argument("-m", dest="modes", help="output mode to benchmark (can be repeated), otherwise all of them", action='append', default=None)
+    parser.add_argument("-n", dest="steps", type=int, help="RF Explorer steps per sweep", default=RFEXPLORER_STEPS)
+    parser.add_argument("-r", dest="rate", type=float, help="sweeps or frames per second sent by the simulators", default=None)
+    parser.add_argument("-d", dest="duration", type=int, help="run each mode for these many seconds", default=DURATION)
+    parser.add_argument("-c", dest="clients", type=int, help="load test the server mode (-l) with these many TCP clients instead", default=0)
+    parser.add_argument("-g", dest="analysis", type=float, help="benchmark analyze.py on synthetic captures of these many GB instead", default=0)
+    parser.add_argument("-j", dest="jobs", type=int, help="analyze.py worker processes to benchmark (can be repeated), otherwise 1 and all the cores", action='append', default=None)
+    parser.add_argument("-S", dest="startup", help="benchmark the startup of the modes instead", action='store_true')
+    parser.add_argument("-t", dest="tree", help="benchmark the scripts in this checkout (e.g. a git worktree of an older revision)", default=None)
+    parser.add_argument("-w", dest="storage", type=int, help="compare writing these many sweeps to recordings and to the output formats instead", default=0)
+    return parser.parse_args()
+
+#---------------------------------------------------------
+# Measurements
+#---------------------------------------------------------
+
+class Run(object):
+    """
+    Runs a script against a simulator, collecting the arrival time of every
+    output line and the CPU time used by the script
+    """
+
+    ansi = re.compile(r"\x1b\[[0-9;]*m")
+    ticks = os.sysconf('SC_CLK_TCK')
+
+    def __init__(self, script, mode, simulator, duration, options = [], tree = None):
+        self.script = script
+        self.tree = tree or os.path.dirname(os.path.abspath(__file__))
+        self.mode = mode
+        self.simulator = simulator
+        self.duration = duration
+        self.options = options
+        self.lines = []
+        self.samples = []
+        self.filename = None
+
+    def cpu(self, pid):
+        """
+        User and system CPU seconds used so far by a process
+        """
+        try:
+            with open("/proc/{0}/stat".format(pid)) as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / self.ticks
+        except (OSError, IOError, IndexError):
+            return None
+
+    def reader(self, stream):
+        for line in stream:
+            self.lines.append((time.time(), self.ansi.sub("", line)))
+
+    def execute(self):
+        command = [sys.executable, self.script, '-p', self.simulator.port, '-m', self.mode, '-d', str(self.duration)] + self.options
+        if self.mode == "record":
+            handle, self.filename = tempfile.mkstemp(suffix=".rftr")
+            os.close(handle)
+            command += ['-w', self.filename]
+
+        # Plots are drawn off screen
+        env = dict(os.environ, MPLBACKEND="Agg")
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, env=env, cwd=self.tree)
+        thread = threading.Thread(target=self.reader, args=(process.stdout,), daemon=True)
+        thread.start()
+
+        while process.poll() is None:
+            cpu = self.cpu(process.pid)
+            if cpu is not None:
+                self.samples.append((time.time(), cpu, self.simulator.sent))
+            time.sleep(SAMPLE_INTERVAL)
+        thread.join()
+
+    def observations(self):
+        """
+        Arrival time and marker code of every row the script produced
+        """
+        if self.filename:
+            recording = RecordingReader(self.filename)
+            times = recording.start + recording.timestamps()
+            codes = [marker_code(amplitude) for amplitude in recording.amplitudes()[:, 0].tolist()]
+            os.remove(self.filename)
+            return list(zip(times.tolist(), codes))
+
+        column = MARKER_COLUMN[self.script].get(self.mode)
+        if column is None:
+            return []
+        observations = []
+        for timestamp, line in self.lines:
+            fields = line.strip().split(",")
+            if len(fields) > column and fields[0].isdigit():
+                observations.append((timestamp, marker_code(float(fields[column]))))
+        return observations
+
+    def results(self):
+        """
+        Rows per second, CPU usage and latency measured from the first row
+        to the last one (or from WARMUP seconds after the first message to the
+        last one for the modes that do not produce rows)
+        """
+        observations = self.observations()
+        times = self.simulator.times
+        if observations:
+            start, end = observations[0][0], observations[-1][0]
+        elif times:
+            start, end = times[0] + WARMUP, times[-1]
+        else:
+            return None
+
+        window = [sample for sample in self.samples if start <= sample[0] <= end]
+        if len(window) < 2:
+            return None
+        (t0, cpu0, sent0), (t1, cpu1, sent1) = window[0], window[-1]
+        elapsed = t1 - t0
+        sent = sent1 - sent0
+
+        rows = [observation for observation in observations if t0 <= observation[0] <= t1]
+        latencies = latency(rows, times)
+
+        return {
+            'sent': sent / elapsed,
+            'rows': len(rows) / elapsed if observations else None,
+            'cpu': 100 * (cpu1 - cpu0) / elapsed,
+            'cpu_sweep': 1000 * (cpu1 - cpu0) / max(sent, 1),
+            'latency': np.percentile(latencies, [50, 95]) * 1000 if latencies else None,
+        }
+
+class LoadClient(threading.Thread):
+    """
+    TCP client of the server mode collecting the arrival time and marker
+    code of every row, slow clients read a few bytes every SLOW_DELAY
+    """
+
+    def __init__(self, port, column, slow):
+        threading.Thread.__init__(self, daemon=True)
+        self.port = port
+        self.column = column
+        self.slow = slow
+        self.rows = []
+
+    def run(self):
+        deadline = time.time() + CONNECT_TIMEOUT
+        while True:
+            connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            if self.slow:
+                connection.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+            try:
+                connection.connect(("127.0.0.1", self.port))
+                break
+            except OSError:
+                connection.close()
+                if time.time() > deadline:
+                    return
+                time.sleep(SAMPLE_INTERVAL)
+        buffer = b""
+        while True:
+            data = connection.recv(4096 if self.slow else 65536)
+            if not data:
+                break
+            now = time.time()
+            lines = (buffer + data).split(b"\n")
+            buffer = lines.pop()
+            for line in lines:
+                fields = line.split(b",")
+                if len(fields) > self.column and fields[0].isdigit():
+                    self.rows.append((now, marker_code(float(fields[self.column]))))
+            if self.slow:
+                time.sleep(SLOW_DELAY)
+        connection.close()
+
+#---------------------------------------------------------
+# Helper methods
+#---------------------------------------------------------
+
+def latency(observations, times):
+    """
+    Seconds from the simulator sending each message to the row arriving
+    """
+    latencies = []
+    for timestamp, code in observations:
+        if code is None:
+            continue
+        count = bisect.bisect_right(times, timestamp)
+        sequence = count - 1 - ((count - 1 - code) % MARKER_CODES)
+        if sequence >= 0:
+            latencies.append(timestamp - times[sequence])
+    return latencies
+
+def load(script, simulator, clients, duration):
+    """
+    Runs the script in server mode with the given number of clients and
+    reports the rows each kind of client got per second and their latency
+    """
+    mode = "swipe" if script == "rfexplorer" else "peak"
+    run = Run(script + ".py", mode, simulator, duration, ['-l', str(SERVER_PORT)])
+    column = MARKER_COLUMN[run.script][mode]
+    group = [LoadClient(SERVER_PORT, column, (index % SLOW_EVERY) == SLOW_EVERY - 1) for index in range(clients)]
+    for client in group:
+        client.start()
+    run.execute()
+    for client in group:
+        client.join()
+
+    # Rates over the time fast clients were getting rows
+    fast = [client for client in group if client.rows and not client.slow]
+    start = min([client.rows[0][0] for client in fast] or [0])
+    end = max([client.rows[-1][0] for client in fast] or [0])
+    elapsed = max(end - start, 1e-6)
+    sent = len([timestamp for timestamp in simulator.times if start <= timestamp <= end])
+    print("{0}.py -m {1} -l, {2} clients, {3:.1f} messages/s sent".format(script, mode, clients, sent / elapsed))
+    print("clients  slow   rows/s   p50 ms   p95 ms")
+    for slow in (False, True):
+        members = [client for client in group if client.slow == slow]
+        if not members:
+            continue
+        rows = sum(len([row for row in client.rows if start <= row[0] <= end]) for client in members) / len(members) / elapsed
+        latencies = np.array(sum((latency(client.rows, simulator.times) for client in members), [])) * 1000
+        percentiles = np.percentile(latencies, [50, 95]) if len(latencies) else [0, 0]
+        print("{0:7d} {1:5s} {2:8.1f} {3:8.1f} {4:8.1f}".format(len(members), "yes" if slow else "no", rows, *percentiles))
+
+def synthetic(filename, kind, size, steps):
+    """
+    Writes a CSV (swipe mode layout with the library messages, UTC
+    timestamps) or recording capture of about size bytes
+    """
+    rng = np.random.default_rng(0)
+    frequencies = np.linspace(863.0, 870.0, steps)
+    pool = rng.normal(RFExplorerSimulator.NOISE_FLOOR, RFExplorerSimulator.NOISE_DEVIATION, (SYNTHETIC_POOL, steps))
+    for frequency, level in RFExplorerSimulator.CARRIERS:
+        pool[:, np.argmin(np.abs(frequencies - frequency))] = level
+    busy = rng.random(SYNTHETIC_POOL) < SYNTHETIC_BUSY
+    pool[busy, np.argmin(np.abs(frequencies - RFExplorerSimulator.BURST[0]))] = RFExplorerSimulator.BURST[1]
+    pool = pool.round(1)
+    start = time.time() - 86400
+
+    if kind == "csv":
+        tails = ["," + ",".join("{0:.1f}".format(value) for value in row) + "\n" for row in pool.tolist()]
+        with open(filename, "w") as f:
+            f.write("\n".join(SYNTHETIC_PREAMBLE) + "\n")
+            f.write("timestamp," + ",".join("{0:.2f}".format(frequency) for frequency in frequencies) + "\n")
+            row = 0
+            while f.tell() < size:
+                f.write("".join("{0:d}".format(int(1000 * (start + index * SYNTHETIC_INTERVAL))) + tails[index % SYNTHETIC_POOL] for index in range(row, row + SYNTHETIC_BLOCK)))
+                row += SYNTHETIC_BLOCK
+                f.write(SYNTHETIC_RETUNE + "\n")
+        return
+
+    writer = RecordingWriter(filename, frequencies, "synthetic", start=start)
+    block = np.zeros(SYNTHETIC_BLOCK, dtype=row_dtype("i2", steps))
+    amplitudes = np.rint(pool * writer.scale).astype(np.int16)
+    rows = size // block.itemsize
+    for row in range(0, rows, SYNTHETIC_BLOCK):
+        indexes = np.arange(row, row + SYNTHETIC_BLOCK)
+        block['timestamp'] = indexes * SYNTHETIC_INTERVAL
+        block['amplitude'] = amplitudes[indexes % SYNTHETIC_POOL]
+        writer.file.write(block.tobytes())
+    writer.close()
+
+def analysis(size, steps, jobs):
+    """
+    Runs analyze.py on synthetic CSV and recording captures with every
+    number of jobs, reporting throughput and peak memory
+    """
+    print("capture      size GB  jobs  seconds     MB/s  max RSS MB")
+    for kind, suffix in (("csv", ".csv"), ("recording", ".rftr")):
+        handle, filename = tempfile.mkstemp(suffix=suffix)
+        os.close(handle)
+        try:
+            synthetic(filename, kind, size, steps)
+            size_mb = os.path.getsize(filename) / 1e6
+            for count in jobs:
+                start = time.time()
+                process = subprocess.Popen([sys.executable, "analyze.py", "-j", str(count), "-o", filename, filename], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__)))
+                _, status, usage = os.wait4(process.pid, 0)
+                elapsed = time.time() - start
+                print("{0:12s} {1:7.1f} {2:5d} {3:8.1f} {4:8.1f} {5:11.1f}".format(kind, size_mb / 1000, count, elapsed, size_mb / elapsed, usage.ru_maxrss / 1024))
+        finally:
+            for name in (filename, filename + ".spectrum.csv", filename + ".duty.csv"):
+                if os.path.exists(name):
+                    os.remove(name)
+
+def startup(script, mode, simulator):
+    """
+    Runs a mode for STARTUP_DURATION seconds, returns the seconds spent
+    importing modules (-X importtime), the seconds from launch until the
+    script reports its first sample and the peak memory in MB
+    """
+    command = [sys.executable, '-X', 'importtime', script, '-p', simulator.port, '-m', mode, '-d', str(STARTUP_DURATION)]
+    filename = None
+    if mode == "record":
+        handle, filename = tempfile.mkstemp(suffix=".rftr")
+        os.close(handle)
+        command += ['-w', filename]
+
+    env = dict(os.environ, MPLBACKEND="Agg")
+    start = time.time()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    imports = 0
+    first = None
+    for line in process.stderr:
+        fields = line.split("|")
+        if line.startswith("import time:") and len(fields) == 3 and fields[1].strip().isdigit():
+            # Only top level imports, nested ones are in their cumulative time
+            if not fields[2].startswith("  "):
+                imports += int(fields[1])
+        elif line.startswith("First") and first is None:
+            first = time.time() - start
+    _, status, usage = os.wait4(process.pid, 0)
+    if filename:
+        os.remove(filename)
+    return imports / 1e6, first, usage.ru_maxrss / 1024
+
+def storage(sweeps, steps):
+    """
+    Writes the same sweeps the way the record and swipe modes do, to a
+    recording (int16 and float32) and to every output format, reporting
+    their size and the sweeps written per second
+    """
+    rng = np.random.default_rng(0)
+    frequencies = np.linspace(863.0, 870.0, steps)
+
+    # RF Explorer amplitudes come in 0.5dB steps
+    pool = np.round(2 * rng.normal(RFExplorerSimulator.NOISE_FLOOR, RFExplorerSimulator.NOISE_DEVIATION, (SYNTHETIC_POOL, steps))) / 2
+    pool = pool.astype(np.float32)
+
+    print("format        sweeps  size MB  bytes/sweep  vs csv  sweeps/s")
+    results = []
+    for name in ("csv", "json", "binary", "record i2", "record f4"):
+        handle, filename = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            start = time.perf_counter()
+            if name.startswith("record"):
+                writer = RecordingWriter(filename, frequencies, "benchmark", dtype=name.split()[1])
+                for index in range(sweeps):
+                    writer.write(index * SYNTHETIC_INTERVAL, pool[index % SYNTHETIC_POOL])
+                writer.close()
+            else:
+                sink = SINKS[name](open(filename, 'wb'))
+                sink.header(["{0:.2f}".format(frequency) for frequency in frequencies])
+                for index in range(sweeps):
+                    sink.row(int(1000 * index * SYNTHETIC_INTERVAL), pool[index % SYNTHETIC_POOL].tolist())
+                sink.close()
+            elapsed = time.perf_counter() - start
+            size = os.path.getsize(filename)
+        finally:
+            os.remove(filename)
+        results.append((name, size, elapsed))
+
+    csv = results[0][1]
+    for name, size, elapsed in results:
+        print("{0:12s} {1:7d} {2:8.1f} {3:12.1f} {4:6.2f} {5:9.0f}".format(name, sweeps, size / 1e6, size / sweeps, size / csv, sweeps / elapsed))
+
+def report(script, mode, results):
+    if results is None:
+        print("{0:14s} {1:10s} no data".format(script, mode))
+        return
+    rows = "{0:8.1f}".format(results['rows']) if results['rows'] is not None else "       -"
+    latency = "{0:8.1f} {1:8.1f}".format(*results['latency']) if results['latency'] is not None else "       -        -"
+    print("{0:14s} {1:10s} {2:8.1f} {3} {4:6.1f} {5:10.2f} {6}".format(script, mode, results['sent'], rows, results['cpu'], results['cpu_sweep'], latency))
+
+#---------------------------------------------------------
+# Main
+#---------------------------------------------------------
+
+try:
+
+    # Parse arguments
+    args = arguments()
+
+    # Offline analysis
+    if args.analysis > 0:
+        analysis(int(args.analysis * 1e9), args.steps, args.jobs or sorted(set([1, os.cpu_count()])))
+        sys.exit(0)
+
+    # Recordings against the output formats
+    if args.storage > 0:
+        storage(args.storage, args.steps)
+        sys.exit(0)
+
+    # Server mode load test
+    if args.clients > 0:
+        for script in (args.scripts or ['rfexplorer', 'pm8000']):
+            if script == "rfexplorer":
+                simulator = RFExplorerSimulator(args.steps, args.rate or RFEXPLORER_RATE, marker=True)
+            else:
+                simulator = PM8000Simulator(args.rate or PM8000_RATE, marker=True)
+            simulator.start()
+            load(script, simulator, args.clients, args.duration)
+            simulator.close()
+        sys.exit(0)
+
+    benchmarks = []
+    for script in (args.scripts or ['rfexplorer', 'pm8000']):
+        modes = RFEXPLORER_MODES if script == "rfexplorer" else PM8000_MODES
+        benchmarks += [(script, mode) for mode in modes if (args.modes is None) or (mode in args.modes)]
+
+    # Startup of every mode
+    if args.startup:
+        print("script         mode       import ms  first sample ms  max RSS MB")
+        for script, mode in benchmarks:
+            if script == "rfexplorer":
+                simulator = RFExplorerSimulator(args.steps, args.rate or RFEXPLORER_RATE)
+            else:
+                simulator = PM8000Simulator(args.rate or PM8000_RATE)
+            simulator.start()
+            imports, first, rss = startup(script + ".py", mode, simulator)
+            simulator.close()
+            first = "{0:16.0f}".format(first * 1000) if first is not None else "               -"
+            print("{0:14s} {1:10s} {2:9.0f} {3} {4:11.1f}".format(script + ".py", mode, imports * 1000, first, rss))
+        sys.exit(0)
+
+    print("script         mode           sent/s   rows/s   cpu% cpu/msg ms   p50 ms   p95 ms")
+    for script, mode in benchmarks:
+        if script == "rfexplorer":
+            simulator = RFExplorerSimulator(args.steps, args.rate or RFEXPLORER_RATE, marker=True)
+        else:
+            simulator = PM8000Simulator(args.rate or PM8000_RATE, marker=True)
+        simulator.start()
+        run = Run(script + ".py", mode, simulator, args.duration, tree=args.tree)
+        run.execute()
+        simulator.close()
+        report(run.script, mode, run.results())
+
+except KeyboardInterrupt:
+    None
+
+except Exception as obEx:
+    print("Error: " + str(obEx))
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import queue
+import argparse
+import textwrap
+import threading
+
+from lib.RFExplorerComm import RFExplorerComm
+from lib.PM8000Comm import PM8000Comm
+from lib.Discovery import find_devices
+from lib.Output import claim_stdout
+from lib.Metrics import metrics
+from lib.Clock import clock
+from lib.Calibration import Calibration, load_tables
+
+#---------------------------------------------------------
+# Configuration
+#---------------------------------------------------------
+
+BAUDRATE = 500000
+DURATION = 60
+FREQ_CENTER = 866.5
+FREQ_SPAN = 7.0
+DEFAULT_FREQUENCY = 169
+QUEUE_SIZE = 10000
+STATS_INTERVAL = 10
+WAIT_TIMEOUT = 1
+STALL_TIMEOUT = 5
+
+# Seconds of every reconnection attempt, a device thread checks for the end
+# of the capture in between so stopping does not wait for a lost device
+RECONNECT_TIMEOUT = 1
+
+#---------------------------------------------------------
+# Command line arguments
+#---------------------------------------------------------
+
+def arguments():
+
+    epilog = """
+Usage examples:
+
+Capture from every RF Explorer and Power Monitor 8000 connected for 10 minutes
+    python {0} -d 600
+
+Capture from two given RF Explorers only, reporting rates every minute
+    python {0} -r /dev/ttyUSB0 -r /dev/ttyUSB1 -i 60
+
+Serve counters and stage timings to Prometheus on port 9100
+    python {0} --metrics 9100
+
+Correct every device with its table (or the one for any device) in cal.csv
+    python {0} -C cal.csv
+
+Stamp samples with UTC milliseconds, print how long they take from arrival to output
+    python {0} --utc --profile
+
+(c) 2019-2024 Xose Pérez (@xoseperez)""".format(sys.argv[0])
+
+    # Parse command line options
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, epilog=textwrap.dedent(epilog))
+    parser.add_argument("-r", dest="rfexplorers", help="RF Explorer port to use (can be repeated), otherwise will try to find them", action='append', default=None)
+    parser.add_argument("-m", dest="meters", help="Power Monitor 8000 port to use (can be repeated), otherwise will try to find them", action='append', default=None)
+    parser.add_argument("-c", dest="freq_center", type=float, help="RF Explorer frequency center", default=FREQ_CENTER)
+    parser.add_argument("-s", dest="freq_span", type=float, help="RF Explorer frequency span", default=FREQ_SPAN)
+    parser.add_argument("-f", dest="freq", type=int, help="Power Monitor 8000 center frequency", default=DEFAULT_FREQUENCY)
+    parser.add_argument("-o", dest="offset", type=float, help="Power Monitor 8000 offset in dB", default=0)
+    parser.add_argument("-C", dest="calibration", help="add the corrections in this file, a [serial,]frequency,correction per line, to the amplitudes", default=None)
+    parser.add_argument("-d", dest="duration", type=int, help="monitor for these many seconds (0 for non-stop)", default=DURATION)
+    parser.add_argument("-i", dest="interval", type=int, help="report per-device rates every these many seconds to stderr (0 to disable)", default=STATS_INTERVAL)
+    parser.add_argument("--metrics", dest="metrics", type=int, help="serve metrics in Prometheus text format on this port", default=None)
+    parser.add_argument("--profile", dest="profile", help="print the time spent in every stage and the latencies to stderr when done", action='store_true')
+    parser.add_argument("--utc", dest="utc", help="timestamps in milliseconds since the epoch (UTC) instead of since the start", action='store_true')
+    return parser.parse_args()
+
+#---------------------------------------------------------
+# Device threads
+#---------------------------------------------------------
+
+class CaptureDevice(threading.Thread):
+
+    kind = "device"
+
+    def __init__(self, port, output, running):
+        threading.Thread.__init__(self, daemon=True)
+        self.port = port
+        self.tag = "{0}@{1}".format(self.kind, os.path.basename(port))
+        self.output = output
+        self.running = running
+        self.samples = 0
+        self.dropped = 0
+        self.errors = 0
+        self.gaps = 0
+
+    def connect(self):
+        return False
+
+    def alive(self):
+        return True
+
+    def reconnect(self):
+        return False
+
+    def close(self):
+        None
+
+    def recover(self):
+        """
+        Called when no data arrived in a while, if the device went away it
+        waits for it to come back and queues a gap marker (no values)
+        """
+        if self.alive():
+            return
+        lost = time.time()
+        print("{0}: device lost, reconnecting...".format(self.tag), file=sys.stderr)
+        while self.running.is_set() and not self.reconnect():
+            None
+        if self.running.is_set():
+            print("{0}: reconnected in {1:.1f}s".format(self.tag, time.time() - lost), file=sys.stderr)
+            self.gaps += 1
+            self.output.put((clock.now(), self.tag, None))
+
+    def emit(self, values, arrival):
+        """
+        Queues a sample and its arrival time for the output thread, samples
+        are dropped (and counted) if the output cannot keep up
+        """
+        try:
+            self.output.put_nowait((arrival, self.tag, values))
+            self.samples += 1
+        except queue.Full:
+            self.dropped += 1
+            metrics.count("dropped")
+
+class CaptureRFExplorer(CaptureDevice):
+
+    kind = "rfexplorer"
+
+    def __init__(self, port, output, running, center, span, tables = None):
+        CaptureDevice.__init__(self, port, output, running)
+        self.center = center
+        self.span = span
+        self.objRFE = RFExplorerComm()
+        self.objRFE.AutoConfigure = False
+        if tables:
+            self.objRFE.calibrate(Calibration(tables))
+
+    def connect(self):
+        if not self.objRFE.connect(self.port, BAUDRATE):
+            return False
+        if not self.objRFE.init():
+            return False
+        if not self.objRFE.IsAnalyzer():
+            return False
+        self.objRFE.range(self.center, self.span)
+        return True
+
+    def alive(self):
+        return self.objRFE.alive(STALL_TIMEOUT)
+
+    def reconnect(self):
+        return self.objRFE.reconnect(RECONNECT_TIMEOUT)
+
+    def run(self):
+        last = 0
+        while self.running.is_set():
+            if not self.objRFE.wait(WAIT_TIMEOUT):
+                self.recover()
+                continue
+            for objSweep in self.objRFE.history.since(last):
+                self.emit(self.objRFE.amplitudes(objSweep).tolist(), objSweep.time)
+            last = self.objRFE.history.count
+
+    def close(self):
+        self.objRFE.Close()
+
+class CapturePM8000(CaptureDevice):
+
+    kind = "pm8000"
+
+    def __init__(self, port, output, running, freq, offset, tables = None):
+        CaptureDevice.__init__(self, port, output, running)
+        self.freq = freq
+        self.offset = offset
+        self.meter = PM8000Comm()
+        if tables:
+            self.meter.calibrate(Calibration(tables))
+
+    def connect(self):
+        if not self.meter.connect(self.port):
+            return False
+        self.meter.configure(self.freq, self.offset)
+        return True
+
+    def alive(self):
+        return self.meter.alive(STALL_TIMEOUT)
+
+    def reconnect(self):
+        return self.meter.reconnect(RECONNECT_TIMEOUT)
+
+    def run(self):
+        while self.running.is_set():
+            values = self.meter.read(WAIT_TIMEOUT)
+            for dbm in values:
+                self.emit([dbm], self.meter.arrival_time)
+            if not values:
+                self.recover()
+            self.errors = self.meter.mismatches
+
+    def close(self):
+        self.meter.close()
+
+#---------------------------------------------------------
+# Helper methods
+#---------------------------------------------------------
+
+def report(devices, elapsed, previous):
+    """
+    Prints the per-device sample rate since the previous report and the
+    samples dropped, frames that could not be parsed and gaps to stderr
+    """
+    for device in devices:
+        samples = device.samples - previous.get(device.tag, 0)
+        previous[device.tag] = device.samples
+        print("{0}: {1:.1f} samples/s, {2} dropped, {3} errors, {4} gaps".format(device.tag, samples / elapsed, device.dropped, device.errors, device.gaps), file=sys.stderr)
+
+#---------------------------------------------------------
+# Main
+#---------------------------------------------------------
+
+devices = []
+running = threading.Event()
+args = None
+status = 0
+startTime = time.time()
+
+try:
+
+    # Parse arguments
+    args = arguments()
+
+    # Only rows go to stdout, the messages of the library go to stderr
+    stdout = claim_stdout()
+
+    output = queue.Queue(QUEUE_SIZE)
+    tables = load_tables(args.calibration) if args.calibration else None
+    running.set()
+    if args.metrics:
+        metrics.serve(args.metrics)
+
+    # Open every device, looking for them does not need a communicator
+    # (and its receive thread)
+    rfexplorers = args.rfexplorers or [device['port'] for device in find_devices(RFExplorerComm.VENDOR_ID, RFExplorerComm.PRODUCT_ID)]
+    meters = args.meters or [device['port'] for device in find_devices(PM8000Comm.VENDOR_ID, PM8000Comm.PRODUCT_ID)]
+    for port in rfexplorers:
+        device = CaptureRFExplorer(port, output, running, args.freq_center, args.freq_span, tables)
+        devices.append(device)
+        if not device.connect():
+            print("Error: could not use RF Explorer at {0}".format(port))
+            sys.exit(1)
+    for port in meters:
+        device = CapturePM8000(port, output, running, args.freq, args.offset, tables)
+        devices.append(device)
+        if not device.connect():
+            print("Error: could not use RF Power monitor at {0}".format(port))
+            sys.exit(1)
+    if len(devices) == 0:
+        print("No devices found")
+        sys.exit(1)
+
+    print("timestamp,device,values", file=stdout)
+    for device in devices:
+        device.start()
+
+    # Merge samples from all devices into a single stream
+    startTime = time.time()
+    lastReport = startTime
+    previous = {}
+    while ((args.duration == 0) or ((time.time() - startTime) < args.duration)):
+
+        try:
+            arrival, tag, values = output.get(timeout=WAIT_TIMEOUT)
+            metrics.gauge("merge_queue_depth", output.qsize())
+            start = time.perf_counter()
+            timestamp = clock.millis(arrival, args.utc)
+            if values is None:
+                print("#gap,{0:06d},{1}".format(timestamp, tag), file=stdout)
+            else:
+                print("{0:06d},{1},{2}".format(timestamp, tag, ",".join("{:.1f}".format(value) for value in values)), file=stdout)
+                metrics.latency("emitted", clock.now() - arrival)
+            metrics.observe("output", time.perf_counter() - start)
+        except queue.Empty:
+            None
+
+        now = time.time()
+        if args.interval and (now - lastReport >= args.interval):
+            report(devices, now - lastReport, previous)
+            lastReport = now
+
+except KeyboardInterrupt:
+    None
+
+except SystemExit as obEx:
+    # Devices are closed below, their receive threads would keep it running
+    status = obEx.code
+
+except Exception as obEx:
+    print("Error: " + str(obEx))
+
+#---------------------------------------------------------
+# Stop threads and release resources
+#---------------------------------------------------------
+
+running.clear()
+for device in devices:
+    if device.is_alive():
+        device.join()
+    device.close()
+
+if len(devices) > 0:
+    print("Totals:", file=sys.stderr)
+    report(devices, time.time() - startTime, {})
+
+if args and args.profile:
+    print(metrics.profile(), file=sys.stderr)
+metrics.close()
+sys.exit(status)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import argparse
+import textwrap
+
+from lib.Recording import RecordingReader
+
+#---------------------------------------------------------
+# Configuration
+#---------------------------------------------------------
+
+CHUNK_SIZE = 10000
+
+#---------------------------------------------------------
+# Command line arguments
+#---------------------------------------------------------
+
+def arguments():
+
+    epilog = """
+Usage examples:
+
+Convert a recording from rfexplorer.py or pm8000.py to CSV
+    python {0} capture.rftr > capture.csv
+
+(c) 2019-2024 Xose Pérez (@xoseperez)""".format(sys.argv[0])
+
+    # Parse command line options
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, epilog=textwrap.dedent(epilog))
+    parser.add_argument("filename", help="recording file")
+    return parser.parse_args()
+
+#---------------------------------------------------------
+# Main
+#---------------------------------------------------------
+
+try:
+
+    # Parse arguments
+    args = arguments()
+
+    reader = RecordingReader(args.filename)
+
+    # Single frequency recordings (pm8000.py) use the peak layout,
+    # sweeps (rfexplorer.py) use the swipe layout
+    if reader.steps == 1:
+        print("timestamp,amplitude")
+    else:
+        print("timestamp," + ",".join("{0:.2f}".format(fFrequency) for fFrequency in reader.frequencies))
+    format = "%06d" + ",%.1f" * reader.steps
+
+    for start in range(0, len(reader), CHUNK_SIZE):
+        timestamps = (1000 * reader.timestamps(start, start + CHUNK_SIZE)).astype(int).tolist()
+        amplitudes = reader.amplitudes(start, start + CHUNK_SIZE).tolist()
+        sys.stdout.write("".join(format % (timestamp, *values) + "\n" for timestamp, values in zip(timestamps, amplitudes)))
+
+except KeyboardInterrupt:
+    None
+
+except BrokenPipeError:
+    None
+
+except Exception as obEx:
+    print("Error: " + str(obEx))
@@ -0,0 +1,255 @@
+#!/usr/bin/python
+
+import io
+import os
+import mmap
+import math
+import warnings
+
+import numpy as np
+
+from lib.Recording import RecordingReader, MAGIC
+
+# Captures are split in tasks of about TASK_BYTES for the process pool and
+# every task reads its part in chunks of about CHUNK_BYTES, so memory use
+# depends on neither the size of the files nor the number of tasks
+TASK_BYTES = 64 * 1024 * 1024
+CHUNK_BYTES = 8 * 1024 * 1024
+
+# CSV timestamps over this are milliseconds since the epoch (--utc)
+EPOCH_MS = 1e11
+
+# Captures of rfexplorer.py start with the messages of the RF Explorer
+# library, the header is looked for in these many bytes
+HEADER_BYTES = 64 * 1024
+
+class Summary(object):
+    """
+    Statistics of the sweeps of a capture, updated chunk by chunk: how
+    often every step is over the threshold, its peak and a histogram of
+    its amplitudes for the percentiles, and for every hour the sweeps
+    with any step of each channel over the threshold. Summaries of
+    different chunks (or files) merge into one
+    """
+
+    DBM_MIN = -130.0
+    DBM_MAX = 20.0
+    RESOLUTION = 0.5
+
+    def __init__(self, steps, threshold, channels):
+        self.threshold = threshold
+        self.channels = channels
+        self.sweeps = 0
+        self.skipped = 0
+        self.epoch = False
+        self.first = math.inf
+        self.last = -math.inf
+        self.above = np.zeros(steps, dtype=np.int64)
+        self.peak = np.full(steps, -np.inf, dtype=np.float32)
+        self.histogram = np.zeros((int(round((self.DBM_MAX - self.DBM_MIN) / self.RESOLUTION)), steps), dtype=np.int64)
+        self.hours = {}
+
+    def update(self, times, amplitudes):
+        """
+        Adds the sweeps (times in seconds, amplitudes in dBm, a row per sweep)
+        """
+        if len(times) == 0:
+            return
+        rows, steps = amplitudes.shape
+        self.sweeps += rows
+        self.first = min(self.first, float(times[0]))
+        self.last = max(self.last, float(times[-1]))
+
+        over = amplitudes > self.threshold
+        self.above += over.sum(axis=0)
+        np.maximum(self.peak, amplitudes.max(axis=0), out=self.peak)
+
+        # Histogram bins of every step are counted at once, offset by step
+        bins = np.clip((amplitudes - self.DBM_MIN) / self.RESOLUTION, 0, len(self.histogram) - 1).astype(np.intp)
+        bins *= steps
+        bins += np.arange(steps)
+        self.histogram += np.bincount(bins.ravel(), minlength=self.histogram.size).reshape(self.histogram.shape)
+
+        # Sweeps and sweeps with each channel occupied, per hour
+        hours, inverse = np.unique(np.floor_divide(times, 3600).astype(np.int64), return_inverse=True)
+        counts = [np.bincount(inverse, minlength=len(hours))]
+        for name, first, last, limit in self.channels:
+            counts.append(np.bincount(inverse, weights=over[:, first:last].any(axis=1), minlength=len(hours)))
+        counts = np.array(counts, dtype=np.int64)
+        for index, hour in enumerate(hours.tolist()):
+            self.add_hour(hour, counts[:, index])
+
+    def add_hour(self, hour, counts):
+        if hour in self.hours:
+            self.hours[hour] += counts
+        else:
+            self.hours[hour] = counts.copy()
+
+    def merge(self, other):
+        self.sweeps += other.sweeps
+        self.skipped += other.skipped
+        self.epoch = self.epoch or other.epoch
+        self.first = min(self.first, other.first)
+        self.last = max(self.last, other.last)
+        self.above += other.above
+        np.maximum(self.peak, other.peak, out=self.peak)
+        self.histogram += other.histogram
+        for hour, counts in other.hours.items():
+            self.add_hour(hour, counts)
+
+    def occupancy(self):
+        """
+        Percentage of the sweeps every step was over the threshold
+        """
+        return 100.0 * self.above / max(self.sweeps, 1)
+
+    def percentile(self, q):
+        """
+        Amplitude of every step not exceeded in q% of the sweeps, to the
+        resolution of the histogram
+        """
+        target = max(1, math.ceil(q / 100.0 * self.sweeps))
+        bins = (np.cumsum(self.histogram, axis=0) < target).sum(axis=0)
+        return self.DBM_MIN + (bins + 0.5) * self.RESOLUTION
+
+    def duty(self):
+        """
+        List of (hour, sweeps, percentage of them each channel was occupied)
+        """
+        return [(hour, int(counts[0]), 100.0 * counts[1:] / max(counts[0], 1)) for hour, counts in sorted(self.hours.items())]
+
+def select_channels(frequencies, bands):
+    """
+    Steps of every (name, start, stop, limit) band in the frequencies as
+    (name, first, last, limit), the whole capture if none is there
+    """
+    channels = []
+    if not np.isnan(frequencies).any():
+        for name, start, stop, limit in bands:
+            first = int(np.searchsorted(frequencies, start - 1e-6, 'left'))
+            last = int(np.searchsorted(frequencies, stop + 1e-6, 'right'))
+            if last > first:
+                channels.append((name, first, last, limit))
+    return channels or [("all", 0, len(frequencies), None)]
+
+class Capture(object):
+    """
+    A recording or a CSV file written by the swipe mode of rfexplorer.py,
+    the peak mode of pm8000.py or convert.py, split in tasks. Lines before
+    the CSV header are skipped. Relative is True for CSV captures stamped
+    with the time since their start instead of UTC (no --utc)
+    """
+
+    relative = False
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.size = os.path.getsize(filename)
+        with open(filename, 'rb') as f:
+            head = f.readline()
+            if not head.startswith(MAGIC):
+                while head and not head.startswith(b"timestamp") and f.tell() < HEADER_BYTES:
+                    head = f.readline()
+                row = f.readline()
+                while row and not row[:1].isdigit() and f.tell() < 2 * HEADER_BYTES:
+                    row = f.readline()
+                self.relative = row[:1].isdigit() and float(row.split(b",")[0]) <= EPOCH_MS
+
+        if head.startswith(MAGIC):
+            reader = RecordingReader(filename)
+            self.kind = "recording"
+            self.frequencies = np.array(reader.frequencies)
+            self.rows = len(reader)
+            self.row_size = reader.rows.dtype.itemsize
+            return
+
+        self.kind = "csv"
+        names = head.decode('utf-8', 'replace').strip().split(",")
+        if names[0] != "timestamp" or len(names) < 2:
+            raise ValueError("{0} is neither a recording nor a CSV capture".format(filename))
+        if names[1:] == ["frequency", "amplitude", "floor"]:
+            raise ValueError("{0} lists peaks, capture the swipe or record modes to analyze the sweeps".format(filename))
+        if names[1:] == ["amplitude"]:
+            self.frequencies = np.array([np.nan])
+        else:
+            self.frequencies = np.array([float(name) for name in names[1:]])
+
+    def tasks(self, threshold, channels):
+        """
+        Arguments of analyze() for every part of the capture
+        """
+        settings = (len(self.frequencies), threshold, channels)
+        if self.kind == "recording":
+            rows = max(1, TASK_BYTES // self.row_size)
+            return [(self.filename, self.kind, first, min(first + rows, self.rows)) + settings for first in range(0, self.rows, rows)]
+        return [(self.filename, self.kind, first, min(first + TASK_BYTES, self.size)) + settings for first in range(0, self.size, TASK_BYTES)]
+
+def line_start(data, offset):
+    """
+    Offset of the first line starting at or after the given one
+    """
+    if offset == 0:
+        return 0
+    index = data.find(b'\n', offset - 1)
+    return len(data) if index < 0 else index + 1
+
+def csv_chunks(filename, first, last):
+    """
+    The lines starting between the given offsets, memory mapped and
+    copied in chunks of about CHUNK_BYTES
+    """
+    with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        position = line_start(data, first)
+        end = line_start(data, last)
+        while position < end:
+            stop = line_start(data, min(position + CHUNK_BYTES, end))
+            yield data[position:stop]
+            position = stop
+
+def parse_csv(data, columns):
+    """
+    Rows of CSV lines with the given number of columns, comments (#QA,
+    #gap...), headers and messages of the RF Explorer library are skipped,
+    returns them and the number of rows with other number of columns (a
+    device changing its steps)
+    """
+    # Rows start with their timestamp, filtering the lines first is much
+    # cheaper than letting loadtxt() fail on them
+    lines = [line for line in data.split(b"\n") if line[:1].isdigit()]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        try:
+            values = np.loadtxt(io.BytesIO(b"\n".join(lines)), delimiter=",", ndmin=2)
+            if values.shape[1] == columns or values.size == 0:
+                return values.reshape(-1, columns), 0
+        except ValueError:
+            None
+        valid = [line for line in lines if line.count(b",") == columns - 1]
+        values = np.loadtxt(io.BytesIO(b"\n".join(valid)), delimiter=",", ndmin=2) if valid else np.zeros((0, columns))
+        return values.reshape(-1, columns), len(lines) - len(valid)
+
+def analyze(task):
+    """
+    Summary of a part of a capture, run by the process pool
+    """
+    filename, kind, first, last, steps, threshold, channels = task
+    summary = Summary(steps, threshold, channels)
+
+    if kind == "recording":
+        reader = RecordingReader(filename)
+        rows = max(1, CHUNK_BYTES // reader.rows.dtype.itemsize)
+        summary.epoch = True
+        for start in range(first, last, rows):
+            stop = min(start + rows, last)
+            summary.update(reader.start + reader.timestamps(start, stop), reader.amplitudes(start, stop))
+        return summary
+
+    for data in csv_chunks(filename, first, last):
+        values, skipped = parse_csv(data, steps + 1)
+        summary.skipped += skipped
+        if len(values) == 0:
+            continue
+        if values[0, 0] > EPOCH_MS:
+            summary.epoch = True
+        summary.update(values[:, 0] / 1000.0, values[:, 1:].astype(np.float32))
+    return summary
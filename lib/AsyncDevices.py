@@ -0,0 +1,233 @@
+#!/usr/bin/python
+
+import asyncio
+import collections
+
+import serial
+
+from lib.RFExplorerComm import RFExplorerComm
+from lib.PM8000Comm import PM8000Comm
+from lib.SweepHistory import SweepHistory
+from lib.Metrics import metrics
+from lib.Clock import clock
+
+# Seconds between checks that a device waited for is still there
+ALIVE_INTERVAL = 1.0
+
+async def wait_event(event, deadline, alive):
+    """
+    Waits until the event is set, for at most ALIVE_INTERVAL seconds or
+    until the deadline (loop time, None for none). A timer sets the event
+    instead of using wait_for(), that starts a task every time. Raises
+    asyncio.TimeoutError past the deadline and ConnectionError if the
+    device went away
+    """
+    loop = asyncio.get_running_loop()
+    interval = ALIVE_INTERVAL
+    if deadline is not None:
+        interval = min(interval, deadline - loop.time())
+        if interval <= 0:
+            raise asyncio.TimeoutError()
+    if event.is_set():
+        return
+    handle = loop.call_later(interval, event.set)
+    try:
+        await event.wait()
+    finally:
+        handle.cancel()
+    if loop.time() >= handle.when() and not alive():
+        raise ConnectionError("Device disconnected")
+
+def deadline(timeout):
+    return None if timeout is None else asyncio.get_running_loop().time() + timeout
+
+class AsyncRFExplorer(object):
+    """
+    Asyncio front end of an RFExplorerComm. The receive thread of the
+    library still reads the port and decodes the messages and wakes the
+    event loop when it queues one, so no thread of ours waits on the
+    device. The queued messages are processed in the default executor,
+    the library sleeps on some of them (configuration changes), as are
+    the calls that block for a while (connecting, resetting, changing
+    the range). Many of them (and AsyncPM8000) can share one event loop
+    """
+
+    def __init__(self, history = SweepHistory.SIZE):
+        self.objRFE = RFExplorerComm(history)
+        self.objRFE.AutoConfigure = False
+        self.loop = None
+        self.event = asyncio.Event()
+        self.pending = False
+
+    def notify(self):
+        # Called from the receive thread for every message, the loop is
+        # only woken up once until it gets to it
+        if not self.pending:
+            self.pending = True
+            self.loop.call_soon_threadsafe(self.wake)
+
+    def wake(self):
+        self.pending = False
+        self.event.set()
+
+    async def run(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+
+    async def connect(self, port = None, baudrate = 500000, reset = False, timeout = RFExplorerComm.INIT_TIMEOUT):
+        """
+        Connects to the unit (the first one found if no port is given),
+        resets it if asked to and waits for its configuration. Returns
+        False if it cannot connect or the unit does not answer in time
+        """
+        self.loop = asyncio.get_running_loop()
+        self.objRFE.listen(self.notify)
+        if not await self.run(self.objRFE.connect, port, baudrate):
+            return False
+        if reset and not await self.run(self.objRFE.reset, RFExplorerComm.RESET_TIMEOUT):
+            return False
+        return await self.run(self.objRFE.init, timeout)
+
+    async def range(self, center, span):
+        await self.run(self.objRFE.range, center, span)
+
+    def tune(self, start, stop):
+        self.objRFE.tune(start, stop)
+
+    def calibrate(self, objCalibration):
+        self.objRFE.calibrate(objCalibration)
+
+    async def reconnect(self, timeout = None):
+        """
+        See RFExplorerComm.reconnect()
+        """
+        return await self.run(self.objRFE.reconnect, timeout)
+
+    async def sweeps(self, timeout = None):
+        """
+        Yields the sweeps (see SweepHistory) received from now on. Raises
+        asyncio.TimeoutError if no sweep arrives for timeout seconds and
+        ConnectionError if the unit goes away. Amplitudes are rows of the
+        history, copy them to keep them
+        """
+        history = self.objRFE.history
+        sequence = history.count
+        fDeadline = deadline(timeout)
+        while True:
+            self.event.clear()
+            await self.run(self.objRFE.wait, 0)
+            objSweeps = history.since(sequence)
+            if objSweeps:
+                for objSweep in objSweeps:
+                    yield objSweep
+                sequence = objSweeps[-1].sequence + 1
+                fDeadline = deadline(timeout)
+            await wait_event(self.event, fDeadline, self.objRFE.alive)
+
+    def frequencies(self, objSweep):
+        return self.objRFE.frequencies(objSweep)
+
+    async def close(self):
+        self.objRFE.listen(None)
+        await self.run(self.objRFE.Close)
+
+class AsyncPM8000(object):
+    """
+    Asyncio front end of a PM8000Comm, the port is read from the event
+    loop when it has data (add_reader) and the frames are parsed there.
+    Readings not consumed yet are kept, up to size, the oldest ones are
+    dropped (and counted) beyond that
+    """
+
+    SIZE = 10000
+
+    def __init__(self, size = SIZE):
+        self.meter = PM8000Comm()
+        self.readings_queue = collections.deque(maxlen=size)
+        self.arrival_time = 0
+        self.event = asyncio.Event()
+        self.fileno = None
+
+    async def connect(self, port = None, freq = None, offset = 0):
+        """
+        Connects to the meter (the first one found if no port is given)
+        and configures it if a frequency is given. Returns False if no
+        meter is found
+        """
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(None, self.meter.connect, port):
+            return False
+        if freq:
+            self.meter.configure(freq, offset)
+        self.watch()
+        return True
+
+    def calibrate(self, calibration):
+        self.meter.calibrate(calibration)
+
+    def configure(self, freq, offset):
+        self.meter.configure(freq, offset)
+
+    def watch(self):
+        self.meter.serial.timeout = 0
+        self.fileno = self.meter.serial.fileno()
+        asyncio.get_running_loop().add_reader(self.fileno, self.readable)
+
+    def unwatch(self):
+        if self.fileno is not None:
+            asyncio.get_running_loop().remove_reader(self.fileno)
+            self.fileno = None
+
+    def readable(self):
+        try:
+            data = self.meter.serial.read(self.meter.serial.in_waiting or 1)
+        except (OSError, serial.SerialException):
+            # Flagged as not connected, readings() raises once it gets here
+            self.unwatch()
+            self.meter.connected = False
+            self.event.set()
+            return
+        if not data:
+            return
+        values = self.meter.process(data, clock.now())
+        if values:
+            arrival = self.meter.arrival_time
+            dropped = len(self.readings_queue) + len(values) - self.readings_queue.maxlen
+            if dropped > 0:
+                metrics.count("readings_dropped", dropped)
+            self.readings_queue.extend((arrival, value) for value in values)
+            self.event.set()
+
+    async def readings(self, timeout = None):
+        """
+        Yields the amplitudes (dBm) read from now on, arrival_time is the
+        monotonic time the last one yielded arrived. Raises
+        asyncio.TimeoutError if no frame arrives for timeout seconds and
+        ConnectionError if the meter goes away
+        """
+        self.readings_queue.clear()
+        expires = deadline(timeout)
+        while True:
+            if self.readings_queue:
+                while self.readings_queue:
+                    self.arrival_time, value = self.readings_queue.popleft()
+                    yield value
+                expires = deadline(timeout)
+            if not self.meter.connected:
+                raise ConnectionError("Power Monitor 8000 disconnected")
+            self.event.clear()
+            await wait_event(self.event, expires, self.meter.alive)
+
+    async def reconnect(self, timeout = None):
+        """
+        See PM8000Comm.reconnect()
+        """
+        self.unwatch()
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(None, self.meter.reconnect, timeout):
+            return False
+        self.watch()
+        return True
+
+    def close(self):
+        self.unwatch()
+        self.meter.close()
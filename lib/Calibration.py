@@ -0,0 +1,101 @@
+#!/usr/bin/python
+
+import re
+import collections
+
+import numpy as np
+
+def device_key(serial):
+    """
+    Serial numbers are compared without dashes or case (the library
+    shows them as 0123-4567-89AB-CDEF)
+    """
+    return re.sub("[^0-9A-Z]", "", (serial or "").upper())
+
+def load_tables(filename):
+    """
+    Reads a calibration file, a frequency (MHz) and correction (dB) pair
+    per line for any device, or a serial number, frequency and correction
+    for the given device only. Lines starting with # are skipped. Returns
+    the tables, frequency sorted, by serial number (None for any device)
+    """
+    rows = collections.defaultdict(list)
+    with open(filename) as f:
+        for number, line in enumerate(f, 1):
+            fields = [field.strip() for field in line.split("#")[0].split(",")]
+            if fields == [""]:
+                continue
+            try:
+                if len(fields) == 2:
+                    rows[None].append((float(fields[0]), float(fields[1])))
+                elif len(fields) == 3:
+                    rows[device_key(fields[0])].append((float(fields[1]), float(fields[2])))
+                else:
+                    raise ValueError()
+            except ValueError:
+                raise ValueError("{0}:{1}: expected [serial,]frequency,correction".format(filename, number))
+    tables = {}
+    for serial, pairs in rows.items():
+        table = np.array(pairs)
+        tables[serial] = table[np.argsort(table[:, 0])]
+    return tables
+
+class Calibration(object):
+    """
+    Corrections (dB) added to the amplitudes of a device to account for
+    the antenna and cable losses, interpolated from its table (or the one
+    for any device) between the frequencies given and kept at the edge
+    values out of them. The correction of every sweep configuration is
+    computed once and kept, so going back to a range (a scan, reconnecting)
+    reuses it
+    """
+
+    CACHE_SIZE = 64
+
+    def __init__(self, tables, size = CACHE_SIZE):
+        self.tables = tables
+        self.size = size
+        self.cache = collections.OrderedDict()
+        self.misses = 0
+
+    def table(self, serial):
+        return self.tables.get(device_key(serial), self.tables.get(None))
+
+    def vector(self, serial, start, step, steps):
+        """
+        Corrections for the frequencies of a sweep as a float32 array, None
+        if there is no table for the device
+        """
+        key = (serial, start, step, steps)
+        vector = self.cache.get(key)
+        if vector is not None:
+            self.cache.move_to_end(key)
+            return vector
+        if key in self.cache:
+            return None
+
+        table = self.table(serial)
+        if table is not None:
+            vector = np.interp(start + step * np.arange(steps), table[:, 0], table[:, 1]).astype(np.float32)
+        self.cache[key] = vector
+        if len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+        self.misses += 1
+        return vector
+
+    def forget(self, serial):
+        """
+        Drops the corrections computed for a device, once it turns out
+        to have another serial number
+        """
+        for key in [key for key in self.cache if key[0] == serial]:
+            del self.cache[key]
+
+    def correction(self, serial, frequency):
+        """
+        Correction for a single frequency, 0 if there is no table
+        """
+        table = self.table(serial)
+        if table is None:
+            return 0.0
+        return float(np.interp(frequency, table[:, 0], table[:, 1]))
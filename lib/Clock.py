@@ -0,0 +1,51 @@
+#!/usr/bin/python
+
+import time
+
+class Clock(object):
+    """
+    Timestamps of the sweeps and samples, taken with the monotonic clock
+    as soon as their bytes arrive so they neither jump with NTP nor carry
+    the time spent parsing, printing or plotting them. It is anchored to
+    UTC once, at start, to turn them into seconds since then or into UTC
+    """
+
+    # Pairs of readings taken to anchor the clock, the closest one is kept
+    ANCHOR_TRIES = 5
+
+    def __init__(self):
+        self.anchor()
+
+    def anchor(self):
+        best = None
+        for _ in range(self.ANCHOR_TRIES):
+            before = time.monotonic()
+            utc = time.time()
+            after = time.monotonic()
+            if best is None or (after - before) < best[0]:
+                best = (after - before, (before + after) / 2, utc)
+        _, self.origin, self.epoch = best
+
+    def now(self):
+        return time.monotonic()
+
+    def elapsed(self, timestamp):
+        """
+        Seconds from the start to the given monotonic time
+        """
+        return timestamp - self.origin
+
+    def utc(self, timestamp):
+        """
+        UTC (seconds since the epoch) of the given monotonic time
+        """
+        return self.epoch + (timestamp - self.origin)
+
+    def millis(self, timestamp, utc = False):
+        """
+        Milliseconds since the start, or since the epoch if utc, as the
+        printers write them
+        """
+        return int(1000 * (self.utc(timestamp) if utc else self.elapsed(timestamp)))
+
+clock = Clock()
@@ -0,0 +1,76 @@
+#!/usr/bin/python
+
+import os
+
+SYS_TTY = '/sys/class/tty'
+PREFIXES = ('ttyUSB', 'ttyACM')
+
+# Last scan results, valid while the same USB devices are behind the same
+# serial ports (see identify())
+cache = { 'entries': None, 'ports': [] }
+
+def usb_device(path):
+    """
+    Walks up the sysfs tree from a tty device to the USB device it belongs to
+    """
+    while path and path != '/' and not os.path.exists(os.path.join(path, 'idVendor')):
+        path = os.path.dirname(path)
+    return path if path and path != '/' else None
+
+def read(path, name):
+    try:
+        with open(os.path.join(path, name)) as f:
+            return f.read().strip()
+    except ( OSError, IOError ):
+        return None
+
+def identify(names):
+    """
+    Name, USB device path and device number of every serial port. The
+    number is assigned every time a device is enumerated, so another
+    adapter taking the same port and even the same USB socket differs
+    """
+    entries = []
+    for name in names:
+        path = usb_device(os.path.realpath(os.path.join(SYS_TTY, name, 'device')))
+        if path:
+            entries.append((name, path, read(path, 'devnum')))
+    return entries
+
+def scan(entries):
+    """
+    Reads vendor ID, product ID and serial number of every USB serial port
+    """
+    ports = []
+    for name, path, devnum in entries:
+        try:
+            ports.append({
+                'port': os.path.join('/dev', name),
+                'vendor_id': int(read(path, 'idVendor'), 16),
+                'product_id': int(read(path, 'idProduct'), 16),
+                'serial': read(path, 'serial'),
+            })
+        except ( ValueError, TypeError ):
+            pass
+    return ports
+
+def find_devices(vendor_id = None, product_id = None, serial = None):
+    """
+    Looks for USB serial ports optionally filtering by vendor ID, product
+    ID and serial number, returns a list of dicts with port, vendor_id,
+    product_id and serial keys. The sysfs scan is cached until a device is
+    plugged or unplugged.
+    """
+    try:
+        entries = identify(sorted(name for name in os.listdir(SYS_TTY) if name.startswith(PREFIXES)))
+    except ( OSError, IOError ):
+        entries = []
+
+    if entries != cache['entries']:
+        cache['ports'] = scan(entries)
+        cache['entries'] = entries
+
+    return [port for port in cache['ports']
+        if ((vendor_id is None) or (port['vendor_id'] == vendor_id))
+        and ((product_id is None) or (port['product_id'] == product_id))
+        and ((serial is None) or (port['serial'] == serial))]
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+
+import time
+
+from lib.Metrics import metrics
+
+class LivePlot(object):
+    """
+    Figure created once, callers update the data of the artists it returns
+    and call refresh() as often as they want, the figure is only redrawn
+    up to fps times per second so acquisition never waits for the GUI.
+    Matplotlib is only imported once a plot is created, it takes longer
+    to load than everything else and needs a display
+    """
+
+    font = {'family': 'serif', 'color':  'darkred', 'weight': 'normal', 'size': 8 }
+
+    # Redraws taking long are spaced so they use at most 1/BUDGET of the time
+    BUDGET = 4
+
+    def __init__(self, xlabel, ylabel, ylim, fps = 10, blit = True):
+
+        import matplotlib.pyplot as plt
+        plt.ion()
+        self.figure, self.axes = plt.subplots()
+        self.axes.set_ylim(*ylim)
+        self.axes.grid(True)
+        self.axes.set_xlabel(xlabel, fontdict=self.font)
+        self.axes.set_ylabel(ylabel, fontdict=self.font)
+
+        # Blitting redraws only the artists over a cached background,
+        # the background is captured again after every full redraw
+        self.blit = blit and self.figure.canvas.supports_blit
+        self.background = None
+        self.dirty = True
+        self.artists = []
+        self.figure.canvas.mpl_connect('draw_event', self.on_draw)
+
+        self.interval = 1.0 / fps
+        self.next = 0
+        self.frames = 0
+        self.updates = 0
+        self.start = time.time()
+
+        plt.show(block=False)
+
+    def line(self, x, y, style, **kwargs):
+        line, = self.axes.plot(x, y, style, animated=self.blit, **kwargs)
+        self.artists.append(line)
+        return line
+
+    def image(self, data, extent, vmin, vmax):
+        image = self.axes.imshow(data, extent=extent, vmin=vmin, vmax=vmax, aspect='auto', interpolation='nearest', animated=self.blit)
+        self.artists.append(image)
+        return image
+
+    def text(self, x, y, text):
+        text = self.axes.text(x, y, text, fontdict=self.font, animated=self.blit)
+        self.artists.append(text)
+        return text
+
+    def remove(self, artist):
+        self.artists.remove(artist)
+        artist.remove()
+
+    def xlim(self, left, right):
+        """
+        Changing the limits changes the ticks, so the next frame is a full redraw
+        """
+        self.axes.set_xlim(left, right)
+        self.dirty = True
+
+    def on_draw(self, event):
+        if self.blit:
+            self.background = self.figure.canvas.copy_from_bbox(self.figure.bbox)
+            for artist in self.artists:
+                self.axes.draw_artist(artist)
+
+    def due(self):
+        """
+        True if the next call to refresh() will draw a frame, callers can
+        use it to skip preparing data for frames that will not be drawn
+        """
+        return time.time() >= self.next
+
+    def refresh(self):
+        """
+        Redraws the figure unless the previous frame is too recent,
+        returns True if a frame was drawn
+        """
+        self.updates += 1
+        now = time.time()
+        if now < self.next:
+            return False
+
+        canvas = self.figure.canvas
+        if self.dirty or not self.blit or self.background is None:
+            canvas.draw()
+            self.dirty = False
+        else:
+            canvas.restore_region(self.background)
+            for artist in self.artists:
+                self.axes.draw_artist(artist)
+            canvas.blit(self.figure.bbox)
+        canvas.flush_events()
+
+        metrics.observe("plot", time.time() - now)
+        self.next = now + max(self.interval, self.BUDGET * (time.time() - now))
+        self.frames += 1
+        return True
+
+    def fps(self):
+        return self.frames / max(time.time() - self.start, 1e-6)
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+
+import time
+import bisect
+import threading
+
+class Histogram(object):
+    """
+    Durations (seconds) counted in fixed buckets, like Prometheus does
+    """
+
+    BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the given quantile
+        """
+        target = q * self.count
+        total = 0
+        for bound, count in zip(self.BUCKETS + (float('inf'),), self.counts):
+            total += count
+            if total >= target:
+                return bound
+        return float('inf')
+
+class Metrics(object):
+    """
+    Counters, gauges, stage duration and latency histograms of the
+    running script, shared by every module through the metrics object
+    below. Updates only take a lock and an addition so they can be left
+    in the hot path
+    """
+
+    PREFIX = "rftools_"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.stages = {}
+        self.latencies = {}
+        self.start = time.time()
+        self.server = None
+
+    def count(self, name, value = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def latency(self, step, seconds):
+        """
+        Time from the arrival of a sweep or sample to the given step
+        (parsed, emitted) of the pipeline
+        """
+        with self.lock:
+            histogram = self.latencies.get(step)
+            if histogram is None:
+                histogram = self.latencies[step] = Histogram()
+            histogram.observe(seconds)
+
+    def histograms(self, lines, name, label, histograms):
+        name = self.PREFIX + name
+        lines.append("# TYPE {0} histogram".format(name))
+        for key, histogram in sorted(histograms.items()):
+            total = 0
+            for bound, count in zip(Histogram.BUCKETS + ("+Inf",), histogram.counts):
+                total += count
+                lines.append('{0}_bucket{{{1}="{2}",le="{3}"}} {4}'.format(name, label, key, bound, total))
+            lines.append('{0}_sum{{{1}="{2}"}} {3:.6f}'.format(name, label, key, histogram.sum))
+            lines.append('{0}_count{{{1}="{2}"}} {3}'.format(name, label, key, histogram.count))
+
+    def text(self):
+        """
+        Prometheus text exposition format
+        """
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append("# TYPE {0}{1}_total counter".format(self.PREFIX, name))
+                lines.append("{0}{1}_total {2}".format(self.PREFIX, name, value))
+            for name, value in sorted(self.gauges.items()):
+                lines.append("# TYPE {0}{1} gauge".format(self.PREFIX, name))
+                lines.append("{0}{1} {2}".format(self.PREFIX, name, value))
+            self.histograms(lines, "stage_seconds", "stage", self.stages)
+            self.histograms(lines, "latency_seconds", "step", self.latencies)
+        lines.append("# TYPE {0}uptime_seconds gauge".format(self.PREFIX))
+        lines.append("{0}uptime_seconds {1:.1f}".format(self.PREFIX, time.time() - self.start))
+        return "\n".join(lines) + "\n"
+
+    def profile(self):
+        """
+        Table with the cost of every stage, the latencies and the counters
+        """
+        elapsed = max(time.time() - self.start, 1e-6)
+        lines = ["stage          calls    total s   mean ms    p95 ms   % time"]
+        with self.lock:
+            for stage, histogram in sorted(self.stages.items()):
+                lines.append("{0:10s} {1:9d} {2:10.3f} {3:9.3f} {4:9.3f} {5:8.2f}".format(stage, histogram.count, histogram.sum,
+                    1000 * histogram.sum / max(histogram.count, 1), 1000 * histogram.quantile(0.95), 100 * histogram.sum / elapsed))
+            if self.latencies:
+                lines.append("latency        calls    mean ms    p50 ms    p95 ms    p99 ms")
+            for step, histogram in sorted(self.latencies.items()):
+                lines.append("{0:10s} {1:9d} {2:10.3f} {3:9.3f} {4:9.3f} {5:9.3f}".format(step, histogram.count, 1000 * histogram.sum / max(histogram.count, 1),
+                    1000 * histogram.quantile(0.5), 1000 * histogram.quantile(0.95), 1000 * histogram.quantile(0.99)))
+            for name, value in sorted(self.counters.items()):
+                lines.append("{0:20s} {1:12d} {2:10.1f}/s".format(name, value, value / elapsed))
+        return "\n".join(lines)
+
+    def serve(self, port, host = ""):
+        """
+        Serves the metrics to Prometheus (or curl) on the given port,
+        the HTTP server is only imported when asked for
+        """
+        import http.server
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = metrics.text().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                None
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+metrics = Metrics()
@@ -0,0 +1,199 @@
+#!/usr/bin/python
+
+import sys
+import time
+import json
+import socket
+import struct
+
+import numpy as np
+
+from lib.Server import Server
+from lib.Metrics import metrics
+
+# Binary sink layout (little endian):
+#   header     BINARY_MAGIC, uint32 column count, uint32 names length
+#              and the column names (utf-8, comma separated)
+#   rows       uint64 timestamp (ms) + column count float32 values
+#
+# Gaps are not marked, they show as a jump in the timestamps.
+
+BINARY_MAGIC = b"RFTS"
+
+# Real stdout once claimed by claim_stdout()
+stdout = None
+
+def claim_stdout():
+    """
+    Keeps stdout for the rows and sends anything else printed from now on
+    to stderr, the RF Explorer library prints its messages (on connecting,
+    on every range change...) from any thread. Returns the real stdout
+    """
+    global stdout
+    if stdout is None:
+        sys.stdout.flush()
+        stdout = sys.stdout
+        sys.stdout = sys.stderr
+    return stdout
+
+class Sink(object):
+    """
+    Collects encoded rows and writes them in batches, every flush_count
+    rows or when the oldest pending row is flush_interval seconds old.
+    Callers should call flush() when idle so the last rows are not held
+    """
+
+    FLUSH_COUNT = 100
+    FLUSH_INTERVAL = 0.5
+
+    def __init__(self, stream, flush_count = FLUSH_COUNT, flush_interval = FLUSH_INTERVAL, colors = None):
+        self.stream = stream
+        self.flush_count = flush_count
+        self.flush_interval = flush_interval
+        self.colors = colors
+        self.pending = []
+        self.deadline = None
+
+    def header(self, names, precision = 1):
+        None
+
+    def row(self, timestamp, values, highlight = False):
+        None
+
+    def gap(self, timestamp, duration):
+        None
+
+    def start(self, data):
+        """
+        Writes the header, a server keeps it for the clients connecting later
+        """
+        self.flush()
+        if isinstance(self.stream, Server):
+            self.stream.start(data)
+        else:
+            self.append(data)
+            self.flush()
+
+    def append(self, data):
+        self.pending.append(data)
+        if self.deadline is None:
+            self.deadline = time.time() + self.flush_interval
+        if (len(self.pending) >= self.flush_count) or (time.time() >= self.deadline):
+            self.flush()
+
+    def flush(self):
+        # The batch is taken before writing it, if the write fails (the
+        # reader went away) it is not written again on close()
+        self.deadline = None
+        if self.pending:
+            start = time.perf_counter()
+            count = len(self.pending)
+            data = b"".join(self.pending)
+            self.pending.clear()
+            self.stream.write(data)
+            self.stream.flush()
+            metrics.observe("output", time.perf_counter() - start)
+            metrics.count("rows", count)
+            metrics.count("output_bytes", len(data))
+
+    def close(self):
+        """
+        Writes the pending rows and closes the stream (but stdout), errors
+        are ignored, the reader may be gone already
+        """
+        try:
+            self.flush()
+            if stdout is None or self.stream is not stdout.buffer:
+                self.stream.close()
+        except OSError:
+            None
+
+class CSVSink(Sink):
+    """
+    Same lines print() used to write, colors are (header, default, highlight)
+    escape sequences or None
+    """
+
+    format = None
+
+    def header(self, names, precision = 1):
+        if isinstance(precision, int):
+            precision = [precision] * len(names)
+        self.format = "%06d" + "".join(",%.{0}f".format(digits) for digits in precision)
+        line = "timestamp," + ",".join(names)
+        if self.colors:
+            line = self.colors[0] + line + self.colors[1]
+        self.start((line + "\n").encode('utf-8'))
+
+    def row(self, timestamp, values, highlight = False):
+        line = self.format % (timestamp, *values)
+        if self.colors:
+            line = (self.colors[2] if highlight else self.colors[1]) + line + self.colors[1]
+        self.append((line + "\n").encode('ascii'))
+
+    def gap(self, timestamp, duration):
+        line = "#gap,%06d,%.1f" % (timestamp, duration)
+        if self.colors:
+            line = self.colors[2] + line + self.colors[1]
+        self.append((line + "\n").encode('ascii'))
+
+class JSONSink(Sink):
+    """
+    JSON Lines, a {"columns": [...]} object followed by one
+    {"timestamp": ms, "values": [...]} object per row
+    """
+
+    format = None
+
+    def header(self, names, precision = 1):
+        if isinstance(precision, int):
+            precision = [precision] * len(names)
+        self.format = '{"timestamp": %d, "values": [' + ", ".join("%.{0}f".format(digits) for digits in precision) + ']}\n'
+        self.start((json.dumps({ 'columns': list(names) }) + "\n").encode('utf-8'))
+
+    def row(self, timestamp, values, highlight = False):
+        self.append((self.format % (timestamp, *values)).encode('ascii'))
+
+    def gap(self, timestamp, duration):
+        self.append(('{"timestamp": %d, "gap": %.1f}\n' % (timestamp, duration)).encode('ascii'))
+
+class BinarySink(Sink):
+    """
+    Fixed size binary rows, see the layout at the top of this file
+    """
+
+    record = None
+
+    def header(self, names, precision = 1):
+        encoded = ",".join(names).encode('utf-8')
+        self.record = np.zeros(1, dtype=[('timestamp', '<u8'), ('values', '<f4', (len(names),))])
+        self.start(BINARY_MAGIC + struct.pack("<II", len(names), len(encoded)) + encoded)
+
+    def row(self, timestamp, values, highlight = False):
+        self.record['timestamp'] = timestamp
+        self.record['values'] = values
+        self.append(self.record.tobytes())
+
+SINKS = { 'csv': CSVSink, 'json': JSONSink, 'binary': BinarySink }
+
+def open_sink(format, path = None, colors = None, listen = None):
+    """
+    Creates the sink for the given format writing to stdout (see
+    claim_stdout()), to the Unix socket listening at path or, if listen is
+    given, to every client of a TCP server on that port. Rows are written
+    as they come to a terminal or a server and batched otherwise, colors
+    are only used on a terminal
+    """
+    if listen:
+        server = Server(listen)
+        return SINKS[format](server, flush_count = 1)
+    if path:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(path)
+        stream = connection.makefile('wb')
+        connection.close()
+    else:
+        stream = claim_stdout().buffer
+
+    interactive = stream.isatty() if path is None else False
+    return SINKS[format](stream, flush_count = 1 if interactive else Sink.FLUSH_COUNT, colors = colors if interactive and format == "csv" else None)
@@ -0,0 +1,213 @@
+#!/usr/bin/python
+
+import os
+import re
+import time
+
+import serial
+
+from lib.Discovery import find_devices
+from lib.Metrics import metrics
+from lib.Clock import clock
+
+class PM8000Comm(object):
+
+    VENDOR_ID = 0x1a86
+    PRODUCT_ID = 0x7523
+    BAUDRATE = 9600
+
+    # Frames look like "$ -72.4...$", keep at most this many bytes
+    # waiting for the closing mark before giving up on a frame
+    MAX_FRAME = 256
+    RECONNECT_INTERVAL = 0.25
+
+    def __init__(self):
+        self.serial = None
+        self.buffer = bytearray()
+        self.pattern = re.compile(rb"[\s0-9.-]+")
+        self.frames = 0
+        self.mismatches = 0
+        self.port = None
+        self.usb_serial = None
+        self.config = None
+        self.connected = False
+        self.last_frame_time = 0
+        self.arrival_time = 0
+        self.calibration = None
+        self.correction = 0.0
+
+    def find(self):
+        """
+        Looks for RF Power Monitor 8000 devices
+        """
+        return [device['port'] for device in find_devices(self.VENDOR_ID, self.PRODUCT_ID)]
+
+    def connect(self, port = None, baudrate = BAUDRATE):
+
+        # Find port
+        if port == None:
+            ports = self.find()
+            if len(ports) > 0:
+                port = ports[0]
+        if port == None:
+            return False
+
+        # Remember the device so reconnect() can find it again
+        self.port = port
+        for device in find_devices(self.VENDOR_ID, self.PRODUCT_ID):
+            if device['port'] == port:
+                self.usb_serial = device['serial']
+
+        # Reads block until data arrives, see read()
+        self.serial = serial.Serial(port=port, baudrate=baudrate, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, bytesize=serial.EIGHTBITS, timeout=None)
+        self.buffer = bytearray()
+        self.connected = self.serial.is_open
+        self.last_frame_time = time.time()
+        return self.connected
+
+    def alive(self, stall = None):
+        """
+        False if the port went away (e.g. the USB cable was unplugged) or,
+        if stall is given, no frame was received for that many seconds
+        """
+        if not self.connected or not os.path.exists(self.port):
+            return False
+        if stall and (time.time() - self.last_frame_time) > stall:
+            return False
+        return True
+
+    def reconnect(self, timeout = None):
+        """
+        Closes the port and waits for the same meter (same USB serial number,
+        or same port if unknown) to come back, then restores the last
+        configuration. Returns False if the timeout expires
+        """
+        self.close()
+
+        deadline = None if timeout is None else time.time() + timeout
+        while (deadline is None) or (time.time() < deadline):
+            if self.usb_serial:
+                ports = [device['port'] for device in find_devices(self.VENDOR_ID, self.PRODUCT_ID, self.usb_serial)]
+            else:
+                ports = [self.port] if os.path.exists(self.port) else []
+            try:
+                if len(ports) > 0 and self.connect(ports[0]):
+                    if self.config:
+                        self.configure(*self.config)
+                    metrics.count("reconnects")
+                    return True
+            except (OSError, serial.SerialException):
+                self.close()
+            time.sleep(self.RECONNECT_INTERVAL)
+
+        return False
+
+    def configure(self, freq, offset):
+        """
+        Sets the center frequency (MHz) and the offset (dB) of the meter
+        """
+        self.config = (freq, offset)
+        if self.calibration:
+            self.correction = self.calibration.correction(self.usb_serial, freq)
+        offset_sign = '-' if offset < 0 else '+'
+        offset_int = abs(int(offset))
+        offset_dec = abs(10*offset) - 10*offset_int
+        message = "$%04d%s%02d.%1d#" % (freq, offset_sign, offset_int, offset_dec)
+        self.serial.write(bytes(message, 'utf-8'))
+
+    def calibrate(self, calibration):
+        """
+        Corrects the amplitudes read from now on with the given Calibration
+        at the configured frequency, on top of the meter offset
+        """
+        self.calibration = calibration
+        self.correction = 0.0
+        if calibration and self.config:
+            self.correction = calibration.correction(self.usb_serial, self.config[0])
+
+    def read(self, timeout = None):
+        """
+        Blocks until new bytes arrive or the timeout (in seconds) expires,
+        returns the list of amplitudes (dBm) in the frames completed so far.
+        arrival_time is the monotonic time their first byte was read.
+        If the port fails it is flagged as not connected, see alive()
+        """
+        if not self.connected:
+            time.sleep(timeout or 0)
+            return []
+        try:
+            self.serial.timeout = timeout
+            data = self.serial.read(1)
+            if data:
+                arrival = clock.now()
+                data += self.serial.read(self.serial.in_waiting)
+        except (OSError, serial.SerialException):
+            self.connected = False
+            return []
+        return self.process(data, arrival) if data else []
+
+    def process(self, data, arrival):
+        """
+        Parses the bytes read (see parse()), with the monotonic time the
+        first of them arrived, and returns the calibrated amplitudes (dBm)
+        """
+        start = time.perf_counter()
+        values = self.parse(data)
+        metrics.observe("parse", time.perf_counter() - start)
+        metrics.count("serial_bytes", len(data))
+        if values:
+            metrics.count("frames", len(values))
+            metrics.latency("parsed", clock.now() - arrival)
+            self.last_frame_time = time.time()
+            self.arrival_time = arrival
+            if self.correction:
+                values = [value + self.correction for value in values]
+        return values
+
+    def parse(self, data):
+        """
+        Appends data to the receive buffer and extracts every complete
+        "$...$" frame, incomplete frames are kept for the next call
+        """
+        values = []
+        self.buffer += data
+
+        while True:
+
+            start = self.buffer.find(b'$')
+            if start < 0:
+                self.buffer.clear()
+                break
+
+            end = self.buffer.find(b'$', start + 1)
+            if end < 0:
+                del self.buffer[:start]
+                if len(self.buffer) > self.MAX_FRAME:
+                    self.buffer.clear()
+                    self.mismatches += 1
+                    metrics.count("parse_errors")
+                break
+
+            result = self.pattern.match(self.buffer, start + 1, end)
+            try:
+                values.append(float(result.group(0).replace(b" ", b"")))
+            except (AttributeError, ValueError):
+                # Not a frame, the closing mark may be the start of the next one
+                self.mismatches += 1
+                metrics.count("parse_errors")
+                del self.buffer[:end]
+                continue
+
+            self.frames += 1
+            del self.buffer[:end + 1]
+
+        return values
+
+    def close(self):
+        self.connected = False
+        if self.serial:
+            try:
+                self.serial.close()
+            except (OSError, serial.SerialException):
+                pass
+            self.serial = None
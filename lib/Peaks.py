@@ -0,0 +1,111 @@
+#!/usr/bin/python
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from lib.Traces import MovingAverage
+
+class PeakDetector(object):
+    """
+    Finds every signal standing out of the noise floor of a sweep. The
+    floor is a running average of a low percentile of the last sweeps, a
+    peak is a local maximum above the floor by threshold dB, above the
+    lowest point on both sides within width steps by prominence dB and
+    the highest within separation steps. Sweeps can be averaged over the
+    last smoothing sweeps first. Work arrays are kept between sweeps and
+    only the candidate maxima are looked at one by one
+    """
+
+    FLOOR_PERCENTILE = 25
+    FLOOR_SIZE = 10
+    THRESHOLD = 10
+    PROMINENCE = 6
+    SEPARATION = 3
+    WIDTH = 10
+
+    def __init__(self, threshold = THRESHOLD, prominence = PROMINENCE, separation = SEPARATION, width = WIDTH, smoothing = 1):
+        self.threshold = threshold
+        self.prominence = prominence
+        self.separation = separation
+        self.width = width
+        self.smoothing = smoothing
+        self.floors = np.zeros(self.FLOOR_SIZE)
+        self.floor_count = 0
+        self.floor = None
+        self.steps = 0
+
+    def resize(self, steps):
+        """
+        Allocates the work arrays for sweeps of the given number of steps
+        """
+        self.steps = steps
+        self.average = MovingAverage(self.smoothing) if self.smoothing > 1 else None
+        if self.average:
+            self.average.resize(steps)
+        self.scratch = np.zeros(steps, dtype=np.float32)
+        self.candidates = np.zeros(steps, dtype=bool)
+        self.above = np.zeros(steps, dtype=bool)
+
+        # Padded copies of the sweep, -inf past the edges so signals at
+        # the edges of the span are found and only the side within the
+        # span counts for their prominence
+        self.padded = np.full(steps + 2, -np.inf, dtype=np.float32)
+        self.highs = np.full(steps + 2 * self.separation, -np.inf, dtype=np.float32)
+        self.lows = np.full(steps + 2 * self.width, -np.inf, dtype=np.float32)
+        item = self.highs.itemsize
+        self.high_windows = as_strided(self.highs, (steps, 2 * self.separation + 1), (item, item), writeable=False)
+        self.low_windows = as_strided(self.lows, (steps + self.width, self.width + 1), (item, item), writeable=False)
+        self.floor_count = 0
+
+    def smooth(self, values):
+        if self.average is None:
+            return values
+        self.average.update(values)
+        return self.average.values
+
+    def estimate(self, values):
+        """
+        Noise floor, the running average of the FLOOR_PERCENTILE of the
+        last FLOOR_SIZE sweeps
+        """
+        self.scratch[:] = values
+        k = (len(values) - 1) * self.FLOOR_PERCENTILE // 100
+        self.scratch.partition(k)
+        self.floors[self.floor_count % self.FLOOR_SIZE] = self.scratch[k]
+        self.floor_count += 1
+        self.floor = self.floors[:min(self.floor_count, self.FLOOR_SIZE)].mean()
+        return self.floor
+
+    def detect(self, values):
+        """
+        Returns the indexes and amplitudes of the peaks of a sweep, sorted
+        by frequency
+        """
+        if len(values) != self.steps:
+            self.resize(len(values))
+        values = self.smooth(values)
+        floor = self.estimate(values)
+
+        # Local maxima (the first step of a plateau) above the threshold
+        padded = self.padded
+        padded[1:-1] = values
+        np.greater(padded[1:-1], padded[:-2], out=self.candidates)
+        np.greater_equal(padded[1:-1], padded[2:], out=self.above)
+        self.candidates &= self.above
+        np.greater(values, floor + self.threshold, out=self.above)
+        self.candidates &= self.above
+        indexes = np.flatnonzero(self.candidates)
+        if len(indexes) == 0:
+            return indexes, values[indexes]
+        amplitudes = values[indexes]
+
+        # Highest within separation steps
+        self.highs[self.separation:self.separation + self.steps] = values
+        keep = amplitudes >= self.high_windows[indexes].max(axis=1)
+
+        # Prominence over the highest of the minima on each side
+        self.lows[self.width:self.width + self.steps] = values
+        base = np.maximum(self.low_windows[indexes].min(axis=1), self.low_windows[indexes + self.width].min(axis=1))
+        keep &= (amplitudes - base) >= self.prominence
+
+        return indexes[keep], amplitudes[keep]
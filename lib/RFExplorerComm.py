@@ -1,48 +1,78 @@
  #!/usr/bin/python
 
 import os
-import re
-import glob
+import sys
 import time
+import queue
 
 import serial.tools.list_ports
+from serial.tools.list_ports_common import ListPortInfo
 import serial
+import numpy as np
 
 import RFExplorer
+from RFExplorer.RFESweepData import RFESweepData
+
+from lib.Discovery import find_devices
+from lib.Metrics import metrics
+from lib.SweepHistory import SweepHistory
+from lib.Clock import clock
+
+class ArrivalQueue(queue.Queue):
+    """
+    Queue between the receive thread of the library and wait(), stamps
+    every sweep with the monotonic time it is queued, as soon as its last
+    bytes are read and decoded, so timestamps do not depend on how long
+    the main thread takes to get to it. The listener, if any, is called
+    from the receive thread after every item is queued
+    """
+
+    listener = None
+
+    def put(self, item, block = True, timeout = None):
+        if isinstance(item, RFESweepData):
+            item.m_fArrivalTime = clock.now()
+        queue.Queue.put(self, item, block, timeout)
+        if self.listener:
+            self.listener()
 
 class RFExplorerComm(RFExplorer.RFECommunicator):
 
     VENDOR_ID = 0x10c4
     PRODUCT_ID = 0xea60
+    RECONNECT_INTERVAL = 0.25
+
+    # Seconds to wait for the unit to report a reset or send its
+    # configuration, and between configuration requests while it boots
+    RESET_TIMEOUT = 5
+    INIT_TIMEOUT = 5
+    CONFIG_RETRY = 0.5
 
-    def __init__(self):
+    # Seconds to wait for the serial number, calibration tables go by it
+    SERIAL_TIMEOUT = 2
+
+    def __init__(self, history = SweepHistory.SIZE):
         RFExplorer.RFECommunicator.__init__(self)
+        # The receive thread is already running but idle until connected
+        self.m_objQueue = ArrivalQueue()
+        self.m_objThread.m_objQueue = self.m_objQueue
+        self.m_objHistory = SweepHistory(history)
+        self.m_arrFrequencyAxis = None
+        self.m_tFrequencyAxisKey = None
+        self.m_sPort = None
+        self.m_sUSBSerial = None
+        self.m_nConnectBaudrate = 500000
+        self.m_tRange = None
+        self.m_fLastSweepTime = 0
+        self.m_objCalibration = None
+        self.m_sCalibrationSerial = ""
+        self.m_bInitializing = False
 
     def find(self):
         """
-        Looks for RF Explorer device
-        """
-        devices = []
-
-        for dn in glob.glob('/sys/bus/usb/devices/*'):
-            try:
-                vid = int(open(os.path.join(dn, "idVendor" )).read().strip(), 16)
-                pid = int(open(os.path.join(dn, "idProduct")).read().strip(), 16)
-                if ((vid == self.VENDOR_ID) and (pid == self.PRODUCT_ID)):
-                    dns = glob.glob(os.path.join(dn, os.path.basename(dn) + "*"))
-                    for sdn in dns:
-                        for fn in glob.glob(os.path.join(sdn, "*")):
-                            if re.search(r"\/ttyUSB[0-9]+$", fn):
-                                devices.append(os.path.join("/dev", os.path.basename(fn)))
-                            pass
-                        pass
-                    pass
-                pass
-            except ( ValueError, TypeError, AttributeError, OSError, IOError ):
-                pass
-            pass
-
-        return devices
+        Looks for RF Explorer devices
+        """
+        return [device['port'] for device in find_devices(self.VENDOR_ID, self.PRODUCT_ID)]
 
     def IsConnectedPort(self, sPortName):
         """True if it is possible connect to specific port, otherwise False 
@@ -104,8 +134,6 @@ class RFExplorerComm(RFExplorer.RFECommunicator):
 
     def connect(self, port = None, baudrate = 500000):
 
-        self.GetConnectedPorts()
-
         # Find port
         if port == None:
             ports = self.find()
@@ -114,34 +142,236 @@ class RFExplorerComm(RFExplorer.RFECommunicator):
         if port == None:
             return False
 
+        # The port is already identified, no need to probe every port in
+        # the system with GetConnectedPorts() before connecting
+        self.m_arrValidCP2102Ports = [ListPortInfo(port)]
+
+        # Remember the device so reconnect() can find it again
+        self.m_sPort = port
+        self.m_nConnectBaudrate = baudrate
+        for device in find_devices(self.VENDOR_ID, self.PRODUCT_ID):
+            if device['port'] == port:
+                self.m_sUSBSerial = device['serial']
+        self.m_fLastSweepTime = time.time()
+
         # Connect to available port
         return self.ConnectPort(port, baudrate) 
 
-    def reset(self):
+    def alive(self, stall = None):
+        """
+        False if the port went away (e.g. the USB cable was unplugged) or,
+        if stall is given, no sweep was received for that many seconds
+        """
+        if not self.m_objSerialPort.is_open or not os.path.exists(self.m_objSerialPort.port):
+            return False
+        try:
+            with self.m_hSerialPortLock:
+                self.m_objSerialPort.in_waiting
+        except (OSError, serial.SerialException):
+            return False
+        if stall and (time.time() - self.m_fLastSweepTime) > stall:
+            return False
+        return True
+
+    def reconnect(self, timeout = None):
+        """
+        Closes the port and waits for the same device (same USB serial number,
+        or same port if unknown) to come back, then requests the configuration
+        and restores the last range(). Returns False if the timeout expires
+        """
+        self.ClosePort()
+
+        deadline = None if timeout is None else time.time() + timeout
+        while (deadline is None) or (time.time() < deadline):
+            if self.m_sUSBSerial:
+                ports = [device['port'] for device in find_devices(self.VENDOR_ID, self.PRODUCT_ID, self.m_sUSBSerial)]
+            else:
+                ports = [self.m_sPort] if os.path.exists(self.m_sPort) else []
+            if len(ports) > 0 and self.connect(ports[0], self.m_nConnectBaudrate) and self.init():
+                if self.m_tRange:
+                    self.range(*self.m_tRange)
+                metrics.count("reconnects")
+                return True
+            self.ClosePort()
+            time.sleep(self.RECONNECT_INTERVAL)
+
+        return False
+
+    def reset(self, timeout = RESET_TIMEOUT):
+        """
+        Resets the unit and waits until it reports the reset, returns False
+        if it does not within timeout seconds. Call init() next, it waits
+        until the unit is ready to answer
+        """
+        deadline = time.time() + timeout
 
         # Reset the unit to start fresh
+        self.m_bIsResetEvent = False
         self.SendCommand("r")
-    
+
         # Wait for unit to notify reset completed
-        while(self.IsResetEvent):
-            pass
-        
-        # Wait for unit to stabilize
-        time.sleep(3)
+        while not self.IsResetEvent:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            self.wait(remaining)
 
-    def init(self):
+        return True
 
-        #Request RF Explorer configuration
-        self.SendCommand_RequestConfigData()
+    def calibrate(self, objCalibration):
+        """
+        Corrects the amplitudes of every sweep received from now on with
+        the given Calibration, None to stop correcting them
+        """
+        self.m_objCalibration = objCalibration
 
-        #Wait to receive configuration and model details
-        while(self.ActiveModel == RFExplorer.RFE_Common.eModel.MODEL_NONE):
-            
-            #Process the received configuration
-            self.ProcessReceivedString(True)    
+    def listen(self, listener):
+        """
+        Calls listener (from the receive thread, it must not block) every
+        time new data is queued for wait(), None to stop calling it
+        """
+        self.m_objQueue.listener = listener
+
+    def tune(self, start, stop):
+        """
+        Sends a new frequency range (MHz) like UpdateDeviceConfig() without
+        its fixed 0.5s wait, sweeps of the new range are told apart by
+        their start frequency
+        """
+        self.SendCommand("C2-F:{0:07d},{1:07d},{2:04d},{3:04d}".format(int(round(start * 1000)), int(round(stop * 1000)), 0, -120))
+
+    def wait(self, timeout = None):
+        """
+        Blocks until the receive thread queues new data or the timeout
+        (in seconds) expires, then processes everything pending.
+        Returns True if new sweeps were received
+        """
+        queue = self.m_objQueue
+        with queue.not_empty:
+            if not queue._qsize():
+                queue.not_empty.wait(timeout)
+
+        # Messages piling up in the queue mean the host is falling behind
+        metrics.gauge("queue_depth", queue._qsize())
+        start = time.perf_counter()
+        bNewSweep, sReceived = self.ProcessReceivedString(True)
+        metrics.observe("parse", time.perf_counter() - start)
+
+        # New sweeps are moved to the history with their arrival time and
+        # calibrated, the library stops storing them (hold mode) once its
+        # container is full
+        objData = self.SweepData
+        nCount = objData.Count
+        if nCount > 0 and self.m_bInitializing:
+            # Not ready yet (see init()), the sweeps are discarded
+            objData.CleanAll()
+            self.HoldMode = False
+        elif nCount > 0:
+            self.m_fLastSweepTime = time.time()
+            fParsed = clock.now()
+            objCalibration = self.m_objCalibration
+            if objCalibration and self.m_sSerialNumber != self.m_sCalibrationSerial:
+                objCalibration.forget(self.m_sCalibrationSerial)
+                self.m_sCalibrationSerial = self.m_sSerialNumber
+            for nIndex in range(nCount):
+                objSweep = objData.GetData(nIndex)
+                fArrival = getattr(objSweep, 'm_fArrivalTime', fParsed)
+                arrCorrection = None
+                if objCalibration:
+                    arrCorrection = objCalibration.vector(self.m_sSerialNumber, objSweep.StartFrequencyMHZ, objSweep.StepFrequencyMHZ, objSweep.TotalSteps)
+                self.m_objHistory.append(objSweep, fArrival, arrCorrection)
+                metrics.latency("parsed", fParsed - fArrival)
+            objData.CleanAll()
+            self.HoldMode = False
+            metrics.count("sweeps", nCount)
+        return bNewSweep
+
+    @property
+    def history(self):
+        """
+        The last sweeps received, see SweepHistory
+        """
+        return self.m_objHistory
+
+    def amplitudes(self, objSweep):
+        """
+        Returns the amplitudes (dBm) of the sweep as a float32 array
+        """
+        return np.array(objSweep.m_arrAmplitude, dtype=np.float32)
+
+    def frequencies(self, objSweep):
+        """
+        Returns the frequencies (MHz) of the sweep steps, the array is
+        only computed again when the sweep configuration changes
+        """
+        key = (objSweep.StartFrequencyMHZ, objSweep.StepFrequencyMHZ, objSweep.TotalSteps)
+        if key != self.m_tFrequencyAxisKey:
+            self.m_arrFrequencyAxis = objSweep.StartFrequencyMHZ + objSweep.StepFrequencyMHZ * np.arange(objSweep.TotalSteps)
+            self.m_tFrequencyAxisKey = key
+        return self.m_arrFrequencyAxis
+
+    def init(self, timeout = INIT_TIMEOUT):
+        """
+        Requests the configuration and waits until the unit sends its model
+        and configuration. A unit still booting after a reset ignores the
+        request, so it is repeated every CONFIG_RETRY seconds. Then asks for
+        the serial number, that units only send when asked, for up to
+        SERIAL_TIMEOUT seconds. Sweeps received until then are discarded so
+        none is calibrated with the table of another device. Returns False
+        if the unit does not send its configuration within timeout seconds
+        """
+        deadline = time.time() + timeout
+        retry = 0
+
+        # Forget the model and serial number of a previous connection
+        self.m_eActiveModel = RFExplorer.RFE_Common.eModel.MODEL_NONE
+        self.m_sSerialNumber = ""
+        self.m_bInitializing = True
+
+        try:
+
+            #Wait to receive configuration and model details
+            while(self.ActiveModel == RFExplorer.RFE_Common.eModel.MODEL_NONE):
+
+                now = time.time()
+                if now >= deadline:
+                    return False
+
+                #Request RF Explorer configuration
+                if now >= retry:
+                    self.SendCommand_RequestConfigData()
+                    retry = now + self.CONFIG_RETRY
+
+                #Process the received configuration
+                self.wait(min(retry, deadline) - now)
+
+            #Wait to receive the serial number
+            deadline = time.time() + self.SERIAL_TIMEOUT
+            retry = 0
+            while not self.m_sSerialNumber:
+
+                now = time.time()
+                if now >= deadline:
+                    if self.m_objCalibration:
+                        print("RF Explorer did not send its serial number, calibrating with the table for any device", file=sys.stderr)
+                    break
+
+                if now >= retry:
+                    self.SendCommand("Cn")
+                    retry = now + self.CONFIG_RETRY
+
+                self.wait(min(retry, deadline) - now)
+
+        finally:
+            self.m_bInitializing = False
+
+        return True
 
     def range(self, center, span):
 
+        # Remembered for reconnect()
+        self.m_tRange = (center, span)
+
         # Check limits
         local_span = span 
         if local_span > self.MaxSpanMHZ:
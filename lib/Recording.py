@@ -0,0 +1,102 @@
+#!/usr/bin/python
+
+import time
+import struct
+
+import numpy as np
+
+# File layout (little endian):
+#   header     HEADER_SIZE bytes, see HEADER_FORMAT
+#   axis       steps float64 frequencies (MHz)
+#   rows       float64 timestamp (seconds since start) + steps amplitudes
+#
+# Amplitudes are stored as float32 or as int16 multiplied by scale, with
+# the default scale of 10 int16 rows keep the 0.1dB resolution of the CSV
+# output at half the size.
+
+MAGIC = b"RFTR"
+VERSION = 1
+HEADER_FORMAT = "<4sH2sfId64s"
+HEADER_SIZE = 128
+
+def row_dtype(dtype, steps):
+    return np.dtype([('timestamp', '<f8'), ('amplitude', '<' + dtype, (steps,))])
+
+class RecordingWriter(object):
+
+    def __init__(self, filename, frequencies, device = "", dtype = "i2", scale = 10.0, start = None):
+        """
+        Creates the recording file and writes the header
+        """
+        if dtype not in ("f4", "i2"):
+            raise ValueError("Unsupported recording type '{0}'".format(dtype))
+
+        self.frequencies = np.asarray(frequencies, dtype='<f8')
+        self.steps = len(self.frequencies)
+        self.scale = scale if dtype == "i2" else 1.0
+        self.start = start or time.time()
+        self.row = np.zeros(1, dtype=row_dtype(dtype, self.steps))
+
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, dtype.encode('ascii'), self.scale, self.steps, self.start, device.encode('utf-8')[:64])
+        self.file = open(filename, 'wb')
+        self.file.write(header.ljust(HEADER_SIZE, b'\0'))
+        self.file.write(self.frequencies.tobytes())
+
+    def write(self, timestamp, amplitudes):
+        """
+        Appends a row, timestamp in seconds since start and amplitudes in dBm
+        """
+        self.row['timestamp'] = timestamp
+        if self.scale != 1.0:
+            self.row['amplitude'] = np.rint(np.asarray(amplitudes) * self.scale)
+        else:
+            self.row['amplitude'] = amplitudes
+        self.file.write(self.row.tobytes())
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+class RecordingReader(object):
+
+    def __init__(self, filename):
+        """
+        Reads the header and maps the rows of a recording file
+        """
+        with open(filename, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+            if len(header) < HEADER_SIZE or header[:4] != MAGIC:
+                raise ValueError("{0} is not a recording file".format(filename))
+            magic, version, dtype, self.scale, self.steps, self.start, device = struct.unpack_from(HEADER_FORMAT, header)
+            if version != VERSION:
+                raise ValueError("Unsupported recording version {0}".format(version))
+            self.dtype = dtype.decode('ascii')
+            self.device = device.rstrip(b'\0').decode('utf-8')
+            self.frequencies = np.frombuffer(f.read(8 * self.steps), dtype='<f8')
+
+        # Memory map complete rows only, the file might still be growing
+        offset = HEADER_SIZE + 8 * self.steps
+        dtype = row_dtype(self.dtype, self.steps)
+        with open(filename, 'rb') as f:
+            f.seek(0, 2)
+            count = (f.tell() - offset) // dtype.itemsize
+        self.rows = np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=(count,)) if count > 0 else np.zeros(0, dtype=dtype)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def timestamps(self, start = 0, stop = None):
+        return self.rows['timestamp'][start:stop]
+
+    def amplitudes(self, start = 0, stop = None):
+        """
+        Returns the amplitudes (dBm) of the given rows as a float32 2D array
+        """
+        values = self.rows['amplitude'][start:stop].astype(np.float32)
+        if self.scale != 1.0:
+            values /= self.scale
+        return values
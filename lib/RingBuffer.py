@@ -0,0 +1,44 @@
+#!/usr/bin/python
+
+import numpy as np
+
+class RingBuffer(object):
+    """
+    Keeps the last rows appended to a 2D array allocated once,
+    appending copies the values in place over the oldest row
+    """
+
+    def __init__(self, rows, columns, dtype = np.float32, fill = 0):
+        self.data = np.full((rows, columns), fill, dtype=dtype)
+        self.rows = rows
+        self.position = 0
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.rows)
+
+    def append(self, values):
+        self.data[self.position] = values
+        self.position = (self.position + 1) % self.rows
+        self.count += 1
+
+    def last(self):
+        return self.data[self.position - 1]
+
+    def newest(self, out):
+        """
+        Copies the rows into out, newest first, without allocating
+        """
+        p = self.position
+        out[:p] = self.data[:p][::-1]
+        out[p:] = self.data[p:][::-1]
+        return out
+
+    def oldest(self, out):
+        """
+        Copies the rows into out, oldest first, without allocating
+        """
+        p = self.position
+        out[:self.rows - p] = self.data[p:]
+        out[self.rows - p:] = self.data[:p]
+        return out
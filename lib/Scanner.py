@@ -0,0 +1,143 @@
+#!/usr/bin/python
+
+import math
+import time
+
+import numpy as np
+
+from RFExplorer import RFE_Common
+
+from lib.SweepHistory import Sweep
+
+class Scanner(object):
+    """
+    Sweeps a frequency range wider than the device span in segments and
+    stitches them into a single sweep per pass. Segments share the same
+    step so the stitched sweep has a uniform frequency axis, and they are
+    visited back and forth so consecutive passes start on the segment the
+    previous one ended with, saving a reconfiguration per pass
+    """
+
+    def __init__(self, objRFE, start, stop, dwell = 1, settle = 1):
+        """
+        Dwell is the number of sweeps kept per segment (the maximum of each
+        step is used) and settle the number of sweeps discarded after each
+        reconfiguration
+        """
+        self.objRFE = objRFE
+        self.dwell = dwell
+        self.settle = settle
+
+        # Whole kHz steps keep every segment start on the same grid
+        start = max(start, objRFE.MinFreqMHZ)
+        stop = min(stop, objRFE.MaxFreqMHZ)
+        steps = objRFE.FreqSpectrumSteps
+        step_khz = max(1, math.floor(1000 * objRFE.MaxSpanMHZ / (steps - 1)))
+        self.step = step_khz / 1000.0
+        self.start = round(start * 1000) / 1000.0
+        self.steps = int((stop - self.start) / self.step) + 1
+
+        self.segments = []
+        for index in range(0, self.steps, steps):
+            segment_start = self.start + index * self.step
+            segment_stop = segment_start + (steps - 1) * self.step
+
+            # The last one is moved back if it goes past the device limit
+            if segment_stop > objRFE.MaxFreqMHZ:
+                segment_stop = self.start + (self.steps - 1) * self.step
+                segment_start = segment_stop - (steps - 1) * self.step
+            self.segments.append((segment_start, segment_stop))
+
+        self.order = list(range(len(self.segments)))
+        self.amplitudes = None
+        self.passes = 0
+        self.stale = 0
+        self.pass_times = []
+
+    def begin(self):
+        """
+        Starts a new pass tuning the device to the first segment, also used
+        to start over after a reconnection
+        """
+        self.position = 0
+        self.last = self.objRFE.history.count
+        self.pass_start = time.time()
+        self.amplitudes = np.full(self.steps, RFE_Common.CONST_MIN_AMPLITUDE_DBM, dtype=np.float32)
+        self.tune()
+
+    def tune(self):
+        segment_start, segment_stop = self.segments[self.order[self.position]]
+        self.objRFE.tune(segment_start, segment_stop)
+        self.pending_settle = self.settle
+        self.hold = None
+        self.collected = 0
+
+    def update(self):
+        """
+        Processes the sweeps received since the last call, returns the
+        list of stitched sweeps for the passes completed
+        """
+        passes = []
+        history = self.objRFE.history
+
+        for objSweep in history.since(self.last):
+            segment_start, segment_stop = self.segments[self.order[self.position]]
+
+            # Sweeps sent before the device applied the new range
+            if abs(objSweep.StartFrequencyMHZ - segment_start) > self.step / 2:
+                self.stale += 1
+                continue
+            if self.pending_settle > 0:
+                self.pending_settle -= 1
+                continue
+
+            values = self.objRFE.amplitudes(objSweep)
+            self.hold = values if self.hold is None else np.maximum(self.hold, values, out=self.hold)
+            self.collected += 1
+            if self.collected < self.dwell:
+                continue
+
+            # Segment done, place it in the pass and move on
+            first = int(round((segment_start - self.start) / self.step))
+            length = min(len(self.hold), self.steps - first)
+            self.amplitudes[first:first + length] = self.hold[:length]
+            self.hold = None
+            self.collected = 0
+            self.position += 1
+
+            if self.position == len(self.segments):
+                passes.append(self.stitch(objSweep.time))
+
+                # Next pass goes the other way, starting with the segment
+                # the device is already tuned to
+                self.order.reverse()
+                self.position = 0
+                continue
+
+            # Later sweeps in this batch belong to the previous segment
+            self.tune()
+            break
+
+        self.last = history.count
+        return passes
+
+    def stitch(self, arrival):
+        """
+        Sweep of the whole range, stamped with the arrival of the sweep
+        completing it
+        """
+        objSweep = Sweep(self.passes, arrival, self.start, self.step, self.amplitudes.copy())
+
+        now = time.time()
+        self.pass_times.append(now - self.pass_start)
+        self.pass_start = now
+        self.passes += 1
+        return objSweep
+
+    def report(self):
+        """
+        Summary of the scan: segments, passes and seconds per pass
+        """
+        refresh = np.mean(self.pass_times) if self.pass_times else 0
+        return "{0} segments of {1:.3f}MHz steps, {2} passes, {3:.2f}s per pass, {4} stale sweeps discarded".format(
+            len(self.segments), self.step, self.passes, refresh, self.stale)
@@ -0,0 +1,147 @@
+#!/usr/bin/python
+
+import sys
+import socket
+import threading
+import collections
+
+class ServerClient(threading.Thread):
+    """
+    Sends the messages queued for one client, a client that does not keep
+    up loses its oldest messages instead of slowing down the others. The
+    header is kept apart from the queue so it is never lost
+    """
+
+    def __init__(self, server, connection, address, header):
+        threading.Thread.__init__(self, daemon=True)
+        self.server = server
+        self.header = header
+        self.connection = connection
+        self.address = "{0}:{1}".format(*address[:2])
+        self.queue = collections.deque(maxlen=server.CLIENT_QUEUE)
+        self.ready = threading.Condition()
+        self.running = True
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, data):
+        with self.ready:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append(data)
+            self.ready.notify()
+
+    def restart(self, header):
+        """
+        Sends a new header next, messages still queued were written under
+        the previous one and are dropped
+        """
+        with self.ready:
+            self.dropped += len(self.queue)
+            self.queue.clear()
+            self.header = header
+            self.ready.notify()
+
+    def run(self):
+        try:
+            while self.running:
+                with self.ready:
+                    while self.running and not self.header and not self.queue:
+                        self.ready.wait()
+                    if not self.running:
+                        break
+                    header, self.header = self.header, None
+                    data = header or self.queue.popleft()
+                self.connection.sendall(data)
+                if not header:
+                    self.sent += 1
+        except OSError:
+            None
+        self.server.remove(self)
+
+    def close(self):
+        with self.ready:
+            self.running = False
+            self.ready.notify()
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            None
+        self.connection.close()
+
+class Server(object):
+    """
+    TCP server used as the stream of an output sink, every message written
+    is shared by all the clients connected at the time (encoded once) and
+    clients connecting later get the header first
+    """
+
+    # Messages waiting for each client, kernel send buffer for each client
+    # (a large one would hide slow clients for minutes) and seconds between
+    # checks for the server being closed while waiting for connections
+    CLIENT_QUEUE = 32
+    SEND_BUFFER = 16384
+    ACCEPT_TIMEOUT = 1
+
+    def __init__(self, port, host = ""):
+        self.socket = socket.create_server((host, port))
+        self.socket.settimeout(self.ACCEPT_TIMEOUT)
+        self.header = b""
+        self.clients = []
+        self.lock = threading.Lock()
+        self.running = True
+        self.thread = threading.Thread(target=self.listen, daemon=True)
+        self.thread.start()
+
+    def listen(self):
+        while self.running:
+            try:
+                connection, address = self.socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.SEND_BUFFER)
+            with self.lock:
+                client = ServerClient(self, connection, address, self.header)
+                self.clients.append(client)
+            client.start()
+            print("Client {0} connected, {1} clients".format(client.address, len(self.clients)), file=sys.stderr)
+
+    def remove(self, client):
+        with self.lock:
+            if client not in self.clients:
+                return
+            self.clients.remove(client)
+        client.close()
+        print("Client {0} disconnected, {1} messages sent, {2} dropped".format(client.address, client.sent, client.dropped), file=sys.stderr)
+
+    def start(self, data):
+        """
+        Sets the header sent to clients before any other message
+        """
+        with self.lock:
+            self.header = data
+            for client in self.clients:
+                client.restart(data)
+
+    def write(self, data):
+        with self.lock:
+            for client in self.clients:
+                client.offer(data)
+
+    def flush(self):
+        None
+
+    def isatty(self):
+        return False
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        self.socket.close()
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            self.remove(client)
@@ -0,0 +1,285 @@
+#!/usr/bin/python
+
+import os
+import pty
+import tty
+import time
+import select
+import threading
+
+import numpy as np
+
+# With marker enabled the first amplitude of every message is -code/2 dBm,
+# code being the message sequence number modulo MARKER_CODES, so tools
+# reading the output can tell which message a row comes from
+MARKER_CODES = 100
+
+def marker_code(amplitude):
+    """
+    Returns the marker code of an amplitude (dBm) or None if it is not one
+    """
+    code = int(round(-2 * amplitude))
+    return code if 0 <= code < MARKER_CODES else None
+
+class Simulator(threading.Thread):
+    """
+    Device simulated on a pseudo terminal, port can be opened like the USB
+    serial port of the real device. Messages are only sent while the port
+    is open, like a device that is not plugged in
+    """
+
+    # Seconds between checks while the port is closed
+    IDLE_INTERVAL = 0.05
+
+    # Generated data has a burst every BURST_PERIOD seconds lasting
+    # BURST_LENGTH seconds, something for triggers to catch
+    BURST_PERIOD = 5
+    BURST_LENGTH = 0.5
+
+    def __init__(self, rate, reader = None, speed = 1.0, loop = False, marker = False):
+        threading.Thread.__init__(self, daemon=True)
+        self.master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        os.close(slave)
+        os.set_blocking(self.master, False)
+
+        self.poll = select.poll()
+        self.poll.register(self.master, select.POLLIN)
+
+        self.rate = rate
+        self.reader = reader
+        self.speed = speed
+        self.loop = loop
+        self.marker = marker
+        self.index = 0
+
+        self.running = threading.Event()
+        self.sending = True
+        self.sent = 0
+        self.times = []
+
+    def stop(self):
+        self.running.clear()
+
+    def close(self):
+        self.stop()
+        if self.is_alive():
+            self.join()
+        os.close(self.master)
+
+    def hungup(self):
+        """
+        True while no one has the port open
+        """
+        events = self.poll.poll(0)
+        return bool(events and events[0][1] & select.POLLHUP)
+
+    def write(self, data):
+        """
+        Writes data as the client reads it, gives up if the port is closed
+        """
+        while data and self.running.is_set() and not self.hungup():
+            try:
+                data = data[os.write(self.master, data):]
+            except BlockingIOError:
+                select.select([], [self.master], [], self.IDLE_INTERVAL)
+
+    def run(self):
+        self.running.set()
+        buffer = bytearray()
+        next = time.time()
+
+        while self.running.is_set():
+
+            # Wait for commands until the next message is due
+            timeout = max(0, next - time.time()) if self.sending else self.IDLE_INTERVAL
+            events = self.poll.poll(1000 * timeout)
+            if events and events[0][1] & select.POLLHUP:
+                self.hangup()
+                time.sleep(self.IDLE_INTERVAL)
+                next = time.time()
+                continue
+            if events and events[0][1] & select.POLLIN:
+                try:
+                    buffer += os.read(self.master, 4096)
+                except BlockingIOError:
+                    None
+            self.receive(buffer)
+
+            now = time.time()
+            if self.sending and now >= next:
+                message = self.message()
+                if message is None:
+                    break
+                self.write(message)
+                self.times.append(time.time())
+                self.sent += 1
+
+                # Do not send a burst to catch up after a pause
+                next = max(next + self.interval(), now - 1)
+
+        self.running.clear()
+
+    def interval(self):
+        """
+        Seconds to the next message, replays follow the recording timestamps
+        """
+        if self.reader is not None and self.index < len(self.reader):
+            timestamps = self.reader.timestamps(self.index - 1, self.index + 1)
+            if len(timestamps) == 2:
+                return max(0, timestamps[1] - timestamps[0]) / self.speed
+        return 1.0 / self.rate
+
+    def amplitudes(self):
+        """
+        Next row of the recording being replayed, None when it is over
+        """
+        if self.index >= len(self.reader):
+            if not self.loop:
+                return None
+            self.index = 0
+        values = self.reader.amplitudes(self.index, self.index + 1)[0]
+        self.index += 1
+        return values
+
+    def bursting(self):
+        return (time.time() % self.BURST_PERIOD) < self.BURST_LENGTH
+
+    def mark(self, values):
+        if self.marker:
+            values[0] = -(self.sent % MARKER_CODES) / 2
+        return values
+
+    def hangup(self):
+        None
+
+    def receive(self, buffer):
+        buffer.clear()
+
+    def message(self):
+        return None
+
+class RFExplorerSimulator(Simulator):
+    """
+    Spectrum analyzer speaking the RF Explorer serial protocol: model,
+    configuration and serial number on request, sweeps at the given rate
+    and frequency range changes
+    """
+
+    MODEL = "#C2-M:003,255,01.28\r\n"
+    SERIAL_NUMBER = "#Sn0123456789ABCDEF\r\n"
+    RESET_BANNER = "(C) Ariel Rocholl 2010-2019\r\n"
+    MIN_FREQ_KHZ = 50000
+    MAX_FREQ_KHZ = 960000
+
+    # Noise floor and its deviation (dBm) and carriers (MHz, dBm) shown
+    # when in range, all of them too weak to be taken as a marker
+    NOISE_FLOOR = -110
+    NOISE_DEVIATION = 2
+    CARRIERS = ((865.2, -62), (868.1, -55), (869.5, -75))
+    BURST = (866.5, -51)
+
+    # Seconds from the reset command to the banner and from the banner
+    # until the unit answers commands again
+    RESET_TIME = 0.3
+    BOOT_TIME = 1.0
+
+    def __init__(self, steps = 112, rate = 10.0, center = 866.5, span = 7.0, reader = None, speed = 1.0, loop = False, marker = False):
+        Simulator.__init__(self, rate, reader, speed, loop, marker)
+        self.steps = steps
+        self.start_khz = int(1000 * (center - span / 2))
+        self.stop_khz = int(1000 * (center + span / 2))
+        if reader is not None:
+            self.steps = reader.steps
+            self.start_khz = int(round(1000 * reader.frequencies[0]))
+            self.stop_khz = int(round(1000 * reader.frequencies[-1]))
+        self.sending = False
+        self.banner = None
+        self.booting = 0
+
+    def config(self):
+        step_hz = int(1000 * (self.stop_khz - self.start_khz) / max(self.steps - 1, 1))
+        return "#C2-F:{0:07d},{1:07d},{2:04d},{3:04d},{4:04d},0,000,{5:07d},{6:07d},{7:07d},{8:05d},{9:04d},000\r\n".format(
+            self.start_khz, step_hz, 0, -120, self.steps,
+            min(self.MIN_FREQ_KHZ, self.start_khz), max(self.MAX_FREQ_KHZ, self.stop_khz), 100000, 100, 0)
+
+    def hangup(self):
+        self.sending = False
+
+    def receive(self, buffer):
+
+        # Commands look like "#" + chr(length) + command
+        while len(buffer) >= 2 and buffer[0:1] == b'#' and len(buffer) >= buffer[1]:
+            command = buffer[2:buffer[1]].decode('latin_1')
+            del buffer[:buffer[1]]
+            now = time.time()
+
+            if command == "C0":
+                if now >= self.booting:
+                    self.write((self.MODEL + self.config()).encode('latin_1'))
+                    self.sending = True
+            elif command == "Cn":
+                self.write(self.SERIAL_NUMBER.encode('latin_1'))
+            elif command.startswith("C2-F:"):
+                if self.reader is None:
+                    self.start_khz = int(command[5:12])
+                    self.stop_khz = int(command[13:20])
+                self.write(self.config().encode('latin_1'))
+            elif command == "r":
+                self.sending = False
+                self.banner = now + self.RESET_TIME
+                self.booting = self.banner + self.BOOT_TIME
+            elif command == "CH":
+                self.sending = False
+
+        if buffer and buffer[0:1] != b'#':
+            buffer.clear()
+
+        if self.banner and time.time() >= self.banner:
+            self.banner = None
+            self.write(self.RESET_BANNER.encode('latin_1'))
+
+    def message(self):
+        if self.reader is not None:
+            values = self.amplitudes()
+            if values is None:
+                return None
+            data = np.clip(np.rint(-2 * self.mark(values)), 0, 255).astype(np.uint8)
+        else:
+            values = np.random.normal(self.NOISE_FLOOR, self.NOISE_DEVIATION, self.steps)
+            step_khz = (self.stop_khz - self.start_khz) / max(self.steps - 1, 1)
+            for frequency, amplitude in self.CARRIERS + ((self.BURST,) if self.bursting() else ()):
+                index = int(round((1000 * frequency - self.start_khz) / step_khz))
+                if 0 < index < self.steps - 1:
+                    values[index - 1:index + 2] = (amplitude - 6, amplitude, amplitude - 6)
+            data = np.clip(np.rint(-2 * values), 0, 255).astype(np.uint8)
+            if self.marker:
+                data[0] = self.sent % MARKER_CODES
+
+        if self.steps > 255:
+            return b"$z" + bytes([self.steps >> 8, self.steps & 0xFF]) + data.tobytes() + b"\r\n"
+        return b"$S" + bytes([self.steps]) + data.tobytes() + b"\r\n"
+
+class PM8000Simulator(Simulator):
+    """
+    RF Power Monitor 8000 sending "$ -72.4$" frames at the given rate,
+    configuration commands are accepted and ignored
+    """
+
+    BURST_LEVEL = -35.0
+
+    def __init__(self, rate = 8.0, level = -72.0, reader = None, speed = 1.0, loop = False, marker = False):
+        Simulator.__init__(self, rate, reader, speed, loop, marker)
+        self.level = level
+
+    def message(self):
+        if self.reader is not None:
+            values = self.amplitudes()
+            if values is None:
+                return None
+            value = float(self.mark(values)[0])
+        else:
+            level = self.BURST_LEVEL if self.bursting() else self.level
+            value = self.mark([level - np.random.random()])[0]
+        return "${0:6.1f}$\r\n".format(value).encode('ascii')
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+
+import numpy as np
+
+from lib.RingBuffer import RingBuffer
+from lib.Metrics import metrics
+
+class Sweep(object):
+    """
+    A sweep of the history with the RFESweepData properties the scripts
+    use, time is the monotonic time it arrived (see Clock). Amplitudes
+    are a row of the history ring, only valid until size newer sweeps
+    arrive, callers keeping them longer must copy them
+    """
+
+    def __init__(self, sequence, time, start, step, amplitudes):
+        self.sequence = sequence
+        self.time = time
+        self.StartFrequencyMHZ = start
+        self.StepFrequencyMHZ = step
+        self.TotalSteps = len(amplitudes)
+        self.m_arrAmplitude = amplitudes
+
+class SweepHistory(object):
+    """
+    Last size sweeps received, amplitudes in a ring allocated once (again
+    if the number of steps changes) instead of a Python object per sweep.
+    Every sweep gets a sequence number that keeps growing, consumers keep
+    the next one they expect and ask for the sweeps since then
+    """
+
+    SIZE = 1000
+
+    def __init__(self, size = SIZE):
+        self.size = size
+        self.ring = None
+        self.times = np.zeros(size)
+        self.starts = np.zeros(size)
+        self.steps = np.zeros(size)
+        self.count = 0
+        self.first = 0
+        self.base = 0
+
+    def __len__(self):
+        return self.count - self.first
+
+    def append(self, objSweep, timestamp, correction = None):
+        """
+        Adds a sweep, the correction (dB per step) is added to its
+        amplitudes in place
+        """
+        if self.ring is None or self.ring.data.shape[1] != objSweep.TotalSteps:
+            self.ring = RingBuffer(self.size, objSweep.TotalSteps)
+            self.first = self.base = self.count
+        row = self.ring.position
+        self.ring.append(objSweep.m_arrAmplitude)
+        if correction is not None:
+            self.ring.data[row] += correction
+        self.times[row] = timestamp
+        self.starts[row] = objSweep.StartFrequencyMHZ
+        self.steps[row] = objSweep.StepFrequencyMHZ
+        self.count += 1
+        self.first = max(self.first, self.count - self.size)
+
+    def get(self, sequence):
+        """
+        Returns the sweep with the given sequence number or None if it is
+        not in the history (anymore)
+        """
+        if not (self.first <= sequence < self.count):
+            return None
+        row = (sequence - self.base) % self.size
+        return Sweep(sequence, self.times[row], self.starts[row], self.steps[row], self.ring.data[row])
+
+    def latest(self):
+        return self.get(self.count - 1)
+
+    def since(self, sequence):
+        """
+        Returns the sweeps from the given sequence number on, sweeps no
+        longer in the history are counted as lost
+        """
+        if sequence < self.first:
+            metrics.count("sweeps_lost", self.first - sequence)
+            sequence = self.first
+        return [self.get(index) for index in range(sequence, self.count)]
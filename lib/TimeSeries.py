@@ -0,0 +1,160 @@
+#!/usr/bin/python
+
+import numpy as np
+
+def search(times, count, value):
+    """
+    First logical index (see Level) of the ring with a time not before value
+    """
+    size = len(times)
+    low, high = max(0, count - size), count
+    while low < high:
+        middle = (low + high) // 2
+        if times[middle % size] < value:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+def gather(data, first, last):
+    """
+    Copy of the rows of the ring between two logical indexes, oldest first
+    """
+    size = len(data)
+    start, stop = first % size, last % size
+    if last - first == 0:
+        return data[:0].copy()
+    if start < stop:
+        return data[start:stop].copy()
+    return np.concatenate((data[start:], data[:stop]))
+
+class Level(object):
+    """
+    Ring of blocks with the time of their first sample, their minimum and
+    their maximum. Blocks are numbered from the first one ever appended
+    (logical index), only the last size are kept. The block being built
+    is kept apart until it is complete
+    """
+
+    def __init__(self, size):
+        self.times = np.zeros(size)
+        self.lows = np.zeros(size, dtype=np.float32)
+        self.highs = np.zeros(size, dtype=np.float32)
+        self.count = 0
+        self.partial = 0
+        self.time = self.low = self.high = 0
+
+    def first(self):
+        return max(0, self.count - len(self.times))
+
+    def push(self):
+        position = self.count % len(self.times)
+        self.times[position] = self.time
+        self.lows[position] = self.low
+        self.highs[position] = self.high
+        self.count += 1
+        self.partial = 0
+
+    def points(self, first, last):
+        """
+        Line through the minimum and the maximum of every block in the range
+        """
+        x = np.repeat(gather(self.times, first, last), 2)
+        y = np.column_stack((gather(self.lows, first, last), gather(self.highs, first, last))).ravel()
+        return x, y
+
+class TimeSeries(object):
+    """
+    Last size samples of a value over time, in rings allocated once, and a
+    pyramid of min/max levels on top of them, every block of a level
+    covering factor blocks of the one below. Appending is O(1) (a full
+    block moves up a level every factor samples) and any span of the
+    history is drawn with about the points asked for, keeping the peaks
+    """
+
+    SIZE = 1000000
+    FACTOR = 8
+
+    # Levels with less blocks than this are not worth keeping
+    MIN_LEVEL = 64
+
+    def __init__(self, size = SIZE, factor = FACTOR):
+        self.times = np.zeros(size)
+        self.values = np.zeros(size, dtype=np.float32)
+        self.factor = factor
+        self.count = 0
+        self.levels = []
+        blocks = size // factor
+        while blocks >= self.MIN_LEVEL:
+            self.levels.append(Level(blocks))
+            blocks //= factor
+
+    def __len__(self):
+        return min(self.count, len(self.times))
+
+    def append(self, time, value):
+        position = self.count % len(self.times)
+        self.times[position] = time
+        self.values[position] = value
+        self.count += 1
+
+        # Add the sample to the block being built in the first level,
+        # completed blocks are added to the one in the next level
+        low = high = value
+        for level in self.levels:
+            if level.partial == 0:
+                level.time, level.low, level.high = time, low, high
+            else:
+                if low < level.low:
+                    level.low = low
+                if high > level.high:
+                    level.high = high
+            level.partial += 1
+            if level.partial < self.factor:
+                break
+            level.push()
+            time, low, high = level.time, level.low, level.high
+
+    def first(self):
+        """
+        Time of the oldest sample kept
+        """
+        return self.times[max(0, self.count - len(self.times)) % len(self.times)]
+
+    def last(self):
+        return self.times[(self.count - 1) % len(self.times)]
+
+    def view(self, start, end, points):
+        """
+        Returns the x and y arrays of a line drawing the samples between
+        the given times with about the given number of points (at most
+        twice the blocks of a level plus a few of the levels below)
+        """
+        first = search(self.times, self.count, start)
+        last = search(self.times, self.count, np.nextafter(end, np.inf))
+        if last - first <= points or not self.levels:
+            return gather(self.times, first, last), gather(self.values, first, last)
+
+        # Coarsest level needed for the span, blocks still being built at
+        # the end are drawn with the levels below and the samples
+        index = 0
+        span = self.factor
+        while index < len(self.levels) - 1 and 2 * (last - first) / span > points:
+            index += 1
+            span *= self.factor
+
+        xs, ys = [], []
+        covered = first
+        for level in reversed(self.levels[:index + 1]):
+            begin = max(covered // span, level.first())
+            stop = min(-(-last // span), level.count)
+            if stop > begin:
+                x, y = level.points(begin, stop)
+                xs.append(x)
+                ys.append(y)
+                covered = stop * span
+            span //= self.factor
+        if last > covered:
+            xs.append(gather(self.times, covered, last))
+            ys.append(gather(self.values, covered, last))
+        return np.concatenate(xs), np.concatenate(ys)
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+
+import numpy as np
+
+from lib.RingBuffer import RingBuffer
+
+# Every trace keeps one value per step, updated in place with every sweep
+# using arrays allocated when the number of steps changes, so they can
+# run for days without allocating
+
+class Trace(object):
+
+    name = None
+
+    def resize(self, steps):
+        self.values = np.zeros(steps, dtype=np.float32)
+        self.count = 0
+
+    def update(self, values):
+        None
+
+class Average(Trace):
+    """
+    Exponential average, alpha is the weight of the newest sweep
+    """
+
+    name = "average"
+    ALPHA = 0.1
+
+    def __init__(self, alpha = ALPHA):
+        self.alpha = alpha
+
+    def resize(self, steps):
+        Trace.resize(self, steps)
+        self.delta = np.zeros(steps, dtype=np.float32)
+
+    def update(self, values):
+        if self.count == 0:
+            self.values[:] = values
+        else:
+            np.subtract(values, self.values, out=self.delta)
+            self.delta *= self.alpha
+            self.values += self.delta
+        self.count += 1
+
+class MovingAverage(Trace):
+    """
+    Average of the last size sweeps, kept as a running sum
+    """
+
+    name = "mean"
+    SIZE = 10
+
+    def __init__(self, size = SIZE):
+        self.size = size
+
+    def resize(self, steps):
+        Trace.resize(self, steps)
+        self.ring = RingBuffer(self.size, steps, dtype=np.float64)
+        self.total = np.zeros(steps)
+
+    def update(self, values):
+        ring = self.ring
+        if len(ring) == ring.rows:
+            self.total -= ring.data[ring.position]
+        ring.append(values)
+        self.total += ring.last()
+        np.divide(self.total, len(ring), out=self.values, casting='unsafe')
+        self.count += 1
+
+class MaxHold(Trace):
+
+    name = "max"
+
+    def update(self, values):
+        if self.count == 0:
+            self.values[:] = values
+        else:
+            np.maximum(self.values, values, out=self.values)
+        self.count += 1
+
+class MinHold(Trace):
+
+    name = "min"
+
+    def update(self, values):
+        if self.count == 0:
+            self.values[:] = values
+        else:
+            np.minimum(self.values, values, out=self.values)
+        self.count += 1
+
+class PeakDecay(Trace):
+    """
+    Max hold falling rate dB every sweep, shows recent peaks only
+    """
+
+    name = "decay"
+    RATE = 0.5
+
+    def __init__(self, rate = RATE):
+        self.rate = rate
+
+    def update(self, values):
+        if self.count == 0:
+            self.values[:] = values
+        else:
+            self.values -= self.rate
+            np.maximum(self.values, values, out=self.values)
+        self.count += 1
+
+TRACES = { trace.name: trace for trace in (Average, MovingAverage, MaxHold, MinHold, PeakDecay) }
+
+class Traces(object):
+    """
+    Processing stage between the device and the printers keeping the
+    given traces, by name, over the sweeps. All of them start over when
+    the number of steps changes (a new frequency range)
+    """
+
+    def __init__(self, names):
+        self.traces = [TRACES[name]() for name in names]
+        self.steps = 0
+
+    def __len__(self):
+        return len(self.traces)
+
+    def __iter__(self):
+        return iter(self.traces)
+
+    def __getitem__(self, name):
+        for trace in self.traces:
+            if trace.name == name:
+                return trace
+        raise KeyError(name)
+
+    def names(self):
+        return [trace.name for trace in self.traces]
+
+    def reset(self):
+        """
+        Starts every trace over, the next sweep being the first one
+        """
+        for trace in self.traces:
+            trace.resize(self.steps)
+
+    def update(self, values):
+        """
+        Updates every trace with the amplitudes of a sweep and returns the
+        first one
+        """
+        if len(values) != self.steps:
+            self.steps = len(values)
+            self.reset()
+        for trace in self.traces:
+            trace.update(values)
+        return self.traces[0].values
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+
+import collections
+
+import numpy as np
+
+class Trigger(object):
+    """
+    Lets sweeps or samples through only around events. The last pre ones
+    are held in memory and, when one crosses the level (or the mask, a
+    level for every frequency), they are written along with it and the
+    next post ones, the window starting over with every crossing
+    """
+
+    def __init__(self, pre, post, level = None, mask = None):
+        self.post = post
+        self.level = level
+        self.mask = mask
+        self.history = collections.deque(maxlen=pre)
+        self.remaining = 0
+        self.axis = None
+        self.limits = None
+        self.events = 0
+        self.written = 0
+        self.total = 0
+
+    def crossed(self, values, frequencies = None):
+        """
+        True if any value is over the level, or over the mask interpolated
+        to the given frequencies (those out of the mask are not checked)
+        """
+        if self.mask is None:
+            return np.max(values) > self.level
+        if frequencies is not self.axis:
+            self.limits = np.interp(frequencies, self.mask[:, 0], self.mask[:, 1], left=np.inf, right=np.inf).astype(np.float32)
+            self.axis = frequencies
+        return bool(np.any(values > self.limits))
+
+    def update(self, fired, write, *args):
+        """
+        Calls write with the given arguments now if fired or within the
+        post window, otherwise holds it (arrays are copied) in the history
+        """
+        self.total += 1
+        if fired:
+            if self.remaining == 0:
+                self.events += 1
+            while self.history:
+                function, arguments = self.history.popleft()
+                function(*arguments)
+                self.written += 1
+            self.remaining = self.post + 1
+
+        if self.remaining > 0:
+            self.remaining -= 1
+            write(*args)
+            self.written += 1
+        elif self.history.maxlen:
+            self.history.append((write, tuple(arg.copy() if isinstance(arg, np.ndarray) else arg for arg in args)))
+
+    def report(self):
+        return "{0} events, {1} of {2} written".format(self.events, self.written, self.total)
+
+def load_mask(filename):
+    """
+    Reads a mask file, a frequency (MHz) and level (dBm) pair per line,
+    lines starting with # are skipped. Levels are interpolated between
+    the frequencies given
+    """
+    mask = np.loadtxt(filename, delimiter=",", comments="#", ndmin=2)
+    return mask[np.argsort(mask[:, 0])]
@@ -1,31 +1,41 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import os
-import re
 import sys
-import glob
 import time
-import serial
 import argparse 
 import textwrap
-
-import matplotlib.pyplot as plt
-from drawnow import *
+import collections
+
+from lib.PM8000Comm import PM8000Comm
+from lib.LivePlot import LivePlot
+from lib.TimeSeries import TimeSeries
+from lib.Recording import RecordingWriter
+from lib.Output import open_sink
+from lib.Trigger import Trigger
+from lib.Metrics import metrics
+from lib.Clock import clock
+from lib.Calibration import Calibration, load_tables
 
 #---------------------------------------------------------
 # Configuration
 #---------------------------------------------------------
 
-BAUDRATE = 9600
 DURATION = 60
-VENDOR_ID = 0x1a86
-PRODUCT_ID = 0x7523
+READ_TIMEOUT = 1
+STALL_TIMEOUT = 5
+RECONNECT_TIMEOUT = 10
 DBM_MIN = -80
 DBM_MAX = 0
 DBM_FILTER = 0
-PLOT_LAST = 100
+PLOT_WINDOW = 60
+PLOT_POINTS = 2000
+PLOT_HISTORY = 1000000
+PLOT_LABELS = 20
+PLOT_FPS = 10
 DEFAULT_FREQUENCY = 169
+TRIGGER_PRE = 50
+TRIGGER_POST = 50
 
 #---------------------------------------------------------
 # Command line arguments
@@ -39,17 +49,50 @@ Usage examples:
 Plot the amplitude in real time
     python {0} -m plot -f 169 -o -20
 
+Plot the last 8 hours, keeping every peak visible
+    python {0} -m plot -f 169 -d 0 -W 28800
+
+Correct the antenna and cable losses at 868MHz with the table in cal.csv
+    python {0} -f 868 -C cal.csv
+
+Record the amplitude to a binary file for a day
+    python {0} -f 868 -d 86400 -m record -w capture.rftr
+
+Serve counters and stage timings to Prometheus on port 9100, print the cost of every stage when done
+    python {0} --metrics 9100 --profile
+
+Record for a week only the 50 samples before and the 200 after the amplitude goes over -40dBm
+    python {0} -f 868 -d 604800 -m record -w events.rftr -T -40 -A 200
+
+Print the amplitude stamped with UTC milliseconds, print how long samples take from arrival to output
+    python {0} --utc --profile
+
 (c) 2019-2021 Xose Pérez (@xoseperez)""".format(sys.argv[0])
 
     # Parse command line options
     parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, epilog=textwrap.dedent(epilog))
     parser.add_argument("-f", dest="freq", help="Center frequency", type=int, default=DEFAULT_FREQUENCY)
     parser.add_argument("-o", dest="offset", help="Offset in dB", type=float, default=0)
-    parser.add_argument("-m", dest="mode", help="Output mode", choices=['peak', 'plot'], default="peak")
+    parser.add_argument("-C", dest="calibration", help="Add the correction at the center frequency from this file, a [serial,]frequency,correction per line", default=None)
+    parser.add_argument("-m", dest="mode", help="Output mode", choices=list(MODES), default="peak")
     parser.add_argument("-t", dest="threshold", help="Annotation threshold", type=int, default=DBM_FILTER)
     parser.add_argument("-d", dest="duration", type=int, help="Monitor for these many seconds (0 for non-stop)", default=DURATION)
     parser.add_argument("-p", dest="port", help="USB port to use, otherwise will try to find it", default=None)
-    return parser.parse_args()
+    parser.add_argument("-w", dest="filename", help="Recording file for the record mode", default=None)
+    parser.add_argument("-W", dest="window", type=float, help="Seconds shown in plot mode (0 for the whole history)", default=PLOT_WINDOW)
+    parser.add_argument("-T", dest="trigger", type=float, help="Only write the samples around those over this level (peak and record modes)", default=None)
+    parser.add_argument("-B", dest="pre", type=int, help="Samples written before the trigger", default=TRIGGER_PRE)
+    parser.add_argument("-A", dest="post", type=int, help="Samples written after the trigger", default=TRIGGER_POST)
+    parser.add_argument("-O", dest="output", help="Output format for the peak mode", choices=['csv', 'json', 'binary'], default="csv")
+    parser.add_argument("-u", dest="socket", help="Write the output to this Unix socket instead of stdout", default=None)
+    parser.add_argument("-l", dest="listen", type=int, help="Serve the output to any number of TCP clients on this port instead of stdout", default=None)
+    parser.add_argument("--metrics", dest="metrics", type=int, help="Serve metrics in Prometheus text format on this port", default=None)
+    parser.add_argument("--profile", dest="profile", help="Print the time spent in every stage and the latencies to stderr when done", action='store_true')
+    parser.add_argument("--utc", dest="utc", help="Timestamps in milliseconds since the epoch (UTC) instead of since the start", action='store_true')
+    args = parser.parse_args()
+    if args.mode == "record" and args.filename == None:
+        parser.error("mode 'record' requires a file name (-w)")
+    return args
 
 #---------------------------------------------------------
 # Printer functions
@@ -67,156 +110,218 @@ class Color:
 
 class PrinterBase(object):
 
-    start = time.time()
     threshold = DBM_FILTER
+    trigger = None
+    utc = False
 
     def __init__(self, threshold):
         self.threshold = threshold
         None
 
+    def timestamp(self, arrival = None):
+        """
+        Milliseconds since the start (or the epoch) when the sample arrived,
+        now if not given
+        """
+        return clock.millis(clock.now() if arrival is None else arrival, self.utc)
+
     def header(self):
         None
 
-    def row(self, value):
+    def row(self, value, arrival):
+        None
+
+    def output(self, value, write, *args):
+        """
+        Calls write with the given arguments now or, with a trigger, only
+        if the sample is close enough to one crossing it
+        """
+        if self.trigger is None:
+            write(*args)
+        else:
+            self.trigger.update(self.trigger.crossed(value), write, *args)
+
+    def gap(self, duration):
+        None
+
+    def flush(self):
+        None
+
+    def close(self):
         None
 
 class PrintPeak(PrinterBase):
 
-    default_color = Color.BLUE
-    highlight_color = Color.YELLOW
+    # Header, default and highlight colors, only used on a terminal
+    colors = (Color.GREEN, Color.BLUE, Color.YELLOW)
+    sink = None
+
+    def __init__(self, threshold, output, socket, listen):
+        PrinterBase.__init__(self, threshold)
+        self.sink = open_sink(output, socket, self.colors, listen)
 
     def header(self):
-        print(Color.GREEN + "timestamp,amplitude" + self.default_color)
+        self.sink.header(["amplitude"])
     
-    def row(self, value):
-        timestamp = int(1000 * (time.time() - self.start))
-        color = self.highlight_color if value > self.threshold else self.default_color
-        print(color + "{0:06d},{1:.1f}".format(timestamp, value) + self.default_color)
+    def row(self, value, arrival):
+        self.output(value, self.write, self.timestamp(arrival), value)
+
+    def write(self, timestamp, value):
+        self.sink.row(timestamp, (value,), value > self.threshold)
+
+    def gap(self, duration):
+        self.sink.gap(self.timestamp(), duration)
+
+    def flush(self):
+        self.sink.flush()
+
+    def close(self):
+        self.sink.close()
 
 class PrintPlot(PrinterBase):
 
-    x = []
-    y = []
-    peaks = []
-    font = None
-
-    def plotter(self):
-        plt.ylim(DBM_MIN, DBM_MAX)
-        plt.grid(True)
-        plt.plot(self.x, self.y, 'r-')
-        plt.xlabel('time (s)', fontdict=self.font)
-        plt.ylabel('amplitude (dBm)', fontdict=self.font)
-        for index in range(len(self.peaks)):
-            peak = self.peaks[index]
-            plt.text(peak.get("x"), peak.get("y") + 1, peak.get("text"), fontdict=self.font)
+    series = None
+    labels = None
+    plot = None
+
+    def __init__(self, threshold, window = PLOT_WINDOW):
+        PrinterBase.__init__(self, threshold)
+        self.window = window
 
     def header(self):
-        self.x = [0] * PLOT_LAST
-        self.y = [DBM_MIN] * PLOT_LAST
-        self.font = {'family': 'serif', 'color':  'darkred', 'weight': 'normal', 'size': 8 }
-        plt.ion()
+        self.series = TimeSeries(PLOT_HISTORY)
+        self.labels = collections.deque()
 
-    def row(self, value):
+        # Figure and artists are created once, rows only update their data
+        self.plot = LivePlot('time (s)', 'amplitude (dBm)', (DBM_MIN, DBM_MAX), PLOT_FPS)
+        self.trace = self.plot.line([], [], 'r-')
 
-        timestamp = time.time() - self.start
+    def row(self, value, arrival):
 
-        self.x.append(timestamp)
-        del self.x[0]
-        self.y.append(value)
-        del self.y[0]
+        timestamp = clock.elapsed(arrival)
+        self.series.append(timestamp, value)
 
+        # Labels are kept oldest first, the newest PLOT_LABELS in view
         if value > self.threshold:
-            peak = dict( x=timestamp, y=value, text="{0:.2f},{1:.1f}".format(timestamp, value))
-            self.peaks.append(peak)
+            label = self.plot.text(timestamp, value + 1, "{0:.2f},{1:.1f}".format(timestamp, value))
+            self.labels.append((timestamp, label))
+            if len(self.labels) > PLOT_LABELS:
+                self.plot.remove(self.labels.popleft()[1])
+
+        # Only frames being drawn get their data, about PLOT_POINTS
+        # points whatever the length of the history shown
+        if self.plot.due():
+            start = self.series.first()
+            if self.window:
+                start = max(start, timestamp - self.window)
+            while self.labels and self.labels[0][0] < start:
+                self.plot.remove(self.labels.popleft()[1])
+            self.trace.set_data(*self.series.view(start, timestamp, PLOT_POINTS))
+            self.plot.xlim(start, max(timestamp, start + 1e-3))
+        self.plot.refresh()
+
+class PrintRecord(PrinterBase):
+
+    writer = None
+
+    def __init__(self, threshold, filename, freq):
+        PrinterBase.__init__(self, threshold)
+        self.filename = filename
+        self.freq = freq
 
-        if len(self.peaks) > 0:
-            if self.peaks[0].get("x") < self.x[0]:
-                del self.peaks[0]
+    def header(self):
+        self.writer = RecordingWriter(self.filename, [self.freq], "PM8000", start=clock.epoch)
+
+    def row(self, value, arrival):
+        self.output(value, self.writer.write, clock.elapsed(arrival), value)
 
-        drawnow(self.plotter)
+    def close(self):
+        if self.writer:
+            self.writer.close()
 
 #---------------------------------------------------------
-# Helper methods
+# Output modes
 #---------------------------------------------------------
 
-def find_devices(vendor_id = None, product_id = None):
-    """
-    Looks for USB devices
-    optionally filtering by with the provided vendor and product IDs
-    """
-    devices = []
-
-    for dn in glob.glob('/sys/bus/usb/devices/*'):
-        try:
-            vid = int(open(os.path.join(dn, "idVendor" )).read().strip(), 16)
-            pid = int(open(os.path.join(dn, "idProduct")).read().strip(), 16)
-            if ((vendor_id is None) or (vid == vendor_id)) and ((product_id is None) or (pid == product_id)):
-                dns = glob.glob(os.path.join(dn, os.path.basename(dn) + "*"))
-                for sdn in dns:
-                    for fn in glob.glob(os.path.join(sdn, "*")):
-                        if re.search(r"\/ttyUSB[0-9]+$", fn):
-                            devices.append(os.path.join("/dev", os.path.basename(fn)))
-                        pass
-                    pass
-                pass
-            pass
-        except ( ValueError, TypeError, AttributeError, OSError, IOError ):
-            pass
-        pass
-
-    return devices
+# Every mode builds its printer from the arguments, the plot mode only
+# imports matplotlib (see LivePlot) once it is chosen and starts
+
+def mode_peak(args):
+    return PrintPeak(args.threshold, args.output, args.socket, args.listen)
+
+def mode_plot(args):
+    return PrintPlot(args.threshold, args.window)
+
+def mode_record(args):
+    return PrintRecord(args.threshold, args.filename, args.freq)
+
+MODES = {
+    "peak": mode_peak,
+    "plot": mode_plot,
+    "record": mode_record,
+}
 
 #---------------------------------------------------------
 # Main
 #---------------------------------------------------------
 
-ser = None
+meter = PM8000Comm()
+printer = None
+args = None
 
 try:
 
     # Parse arguments
     args = arguments()
+    if args.metrics:
+        metrics.serve(args.metrics)
 
-    port = args.port
-    if port == None:
-        ports = find_devices(VENDOR_ID, PRODUCT_ID)
-        if len(ports) > 0:
-            port = ports[0]
-    if port == None:
+    if not meter.connect(args.port):
         print("RF Power monitor not found")
         sys.exit(1)
-    ser = serial.Serial(port=port, baudrate=BAUDRATE, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, bytesize=serial.EIGHTBITS, timeout=0)
 
     # Get mode printer
-    printer = None
-    if args.mode == "peak":
-        printer = PrintPeak(args.threshold)
-    if args.mode == "plot":
-        printer = PrintPlot(args.threshold)
-    if printer == None:
-        print("Invalid mode '{0}'".format(args.mode))
-        sys.exit(1)
+    printer = MODES[args.mode](args)
+    printer.utc = args.utc
+    if args.trigger is not None:
+        printer.trigger = Trigger(args.pre, args.post, level=args.trigger)
     printer.header()
 
-    pattern = re.compile("\$([\s0-9.-]+).*\$")
     startTime = time.time()
 
     # Configure meter
-    offset_sign = '-' if args.offset < 0 else '+'
-    offset_int = abs(int(args.offset))
-    offset_dec = abs(10*args.offset) - 10*offset_int
-    message = "$%04d%s%02d.%1d#" % (args.freq, offset_sign, offset_int, offset_dec)
-    ser.write(bytes(message, 'utf-8'))
+    if args.calibration:
+        meter.calibrate(Calibration(load_tables(args.calibration)))
+    meter.configure(args.freq, args.offset)
 
+    lost = None
+    first = True
     while ((args.duration == 0) or ((time.time() - startTime) < args.duration)):    
-        try:
-            line = ser.readline().decode('utf-8')
-            result = pattern.match(line)
-            if result:
-                dbm = float(result.group(1).replace(" ", ""))
-                printer.row(dbm)
-        except UnicodeDecodeError:
-            None
+
+        # Sleep until the meter sends new data
+        values = meter.read(READ_TIMEOUT)
+        start = time.perf_counter()
+        for dbm in values:
+            printer.row(dbm, meter.arrival_time)
+            metrics.latency("emitted", clock.now() - meter.arrival_time)
+        if values:
+            metrics.observe("process", time.perf_counter() - start)
+            if first:
+                print("First reading in {0:.2f}s".format(time.time() - startTime), file=sys.stderr)
+                first = False
+
+        # Do not hold batched rows while idle
+        if not values:
+            printer.flush()
+
+        # Meter unplugged or silent, find it again and resume
+        if not values and not meter.alive(STALL_TIMEOUT):
+            lost = lost or meter.last_frame_time
+            print("Device lost, reconnecting...", file=sys.stderr)
+            if meter.reconnect(RECONNECT_TIMEOUT):
+                print("Reconnected, {0:.1f}s without data".format(time.time() - lost), file=sys.stderr)
+                printer.gap(time.time() - lost)
+                lost = None
 
 except KeyboardInterrupt:
     None
@@ -224,5 +329,15 @@ except KeyboardInterrupt:
 except Exception as obEx:
     print("Error: " + str(obEx))
 
-if ser:
-    ser.close()
+try:
+    if printer:
+        printer.close()
+        if printer.trigger:
+            print("Trigger: " + printer.trigger.report(), file=sys.stderr)
+
+finally:
+    meter.close()
+
+if args and args.profile:
+    print(metrics.profile(), file=sys.stderr)
+metrics.close()
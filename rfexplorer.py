@@ -6,10 +6,20 @@ import time
 import argparse
 import textwrap
 
-import matplotlib.pyplot as plt
-from drawnow import *
+import numpy as np
 
 from lib.RFExplorerComm import RFExplorerComm
+from lib.LivePlot import LivePlot
+from lib.Output import open_sink, claim_stdout
+from lib.Scanner import Scanner
+from lib.Peaks import PeakDetector
+from lib.Traces import Traces, TRACES
+from lib.Trigger import Trigger, load_mask
+from lib.Metrics import metrics
+from lib.Clock import clock
+from lib.Calibration import Calibration, load_tables
+from lib.RingBuffer import RingBuffer
+from lib.Recording import RecordingWriter
 
 #---------------------------------------------------------
 # Configuration
@@ -23,6 +33,18 @@ FREQ_FROM = FREQ_CENTER - FREQ_SPAN / 2
 FREQ_TO = FREQ_CENTER + FREQ_SPAN / 2
 DBM_MIN = -120
 DBM_MAX = 0
+PLOT_FPS = 10
+WATERFALL_SIZE = 200
+WAIT_TIMEOUT = 1
+STALL_TIMEOUT = 5
+RECONNECT_TIMEOUT = 10
+RESET_TIMEOUT = 5
+INIT_TIMEOUT = 5
+SCAN_DWELL = 1
+SCAN_SETTLE = 1
+PEAK_THRESHOLD = 10
+TRIGGER_PRE = 50
+TRIGGER_POST = 50
 
 #---------------------------------------------------------
 # Command line arguments
@@ -36,14 +58,45 @@ Usage examples:
 Monitor and print peaks from 863.0 to 870.0 for 60 seconds
     python {0} -f 863 -t 870 -d 60
 
+Print every signal 6dB over the noise floor, averaging the last 10 sweeps
+    python {0} -f 863 -t 870 -k 6 -a 10
+
 Plot range of frequencies in real time
     python {0} -m plot
 
+Plot the average and the max hold, print the average of the last 10 sweeps
+    python {0} -m plot -e average -e max
+    python {0} -m swipe -e mean
+
+Show the last 500 sweeps as a waterfall
+    python {0} -m waterfall -n 500
+
+Serve sweeps as JSON Lines to every client connecting to port 5000
+    python {0} -m swipe -o json -l 5000
+
+Correct the antenna and cable losses with the table for this device in cal.csv
+    python {0} -f 863 -t 870 -m swipe -C cal.csv
+
+Survey from 400 to 960 MHz, wider than the device span, stitching several sweeps
+    python {0} -f 400 -t 960 -m swipe
+
+Record sweeps from 863.0 to 870.0 to a binary file for a day
+    python {0} -f 863 -t 870 -d 86400 -m record -w capture.rftr
+
+Serve counters and stage timings to Prometheus on port 9100, print the cost of every stage when done
+    python {0} -m swipe --metrics 9100 --profile
+
+Record for a week only the 20 sweeps before and the 100 after any step goes over -80dBm
+    python {0} -f 863 -t 870 -d 604800 -m record -w events.rftr -T -80 -B 20 -A 100
+
+Print sweeps stamped with UTC milliseconds, print how long they take from arrival to output
+    python {0} -m swipe --utc --profile
+
 (c) 2019-2024 Xose Pérez (@xoseperez)""".format(sys.argv[0])
 
     # Parse command line options
     parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, epilog=textwrap.dedent(epilog))
-    parser.add_argument("-m", dest="mode", help="output mode", choices=['peak', 'swipe', 'plot'], default="peak")
+    parser.add_argument("-m", dest="mode", help="output mode", choices=list(MODES), default="peak")
     parser.add_argument("-r", dest="reset", help="reset RF Explorer", action='store_true')
     parser.add_argument("-c", dest="freq_center", type=float, help="frequency center", default=None)
     parser.add_argument("-s", dest="freq_span", type=float, help="frequency span", default=FREQ_SPAN)
@@ -51,7 +104,26 @@ Plot range of frequencies in real time
     parser.add_argument("-t", dest="freq_to", type=float, help="frequency start", default=None)
     parser.add_argument("-d", dest="duration", type=int, help="monitor for these many seconds (0 for non-stop)", default=DURATION)
     parser.add_argument("-p", dest="port", help="USB port to use, otherwise will try to find it", default=None)
-    return parser.parse_args()
+    parser.add_argument("-w", dest="filename", help="recording file for the record mode", default=None)
+    parser.add_argument("-n", dest="sweeps", type=int, help="sweeps shown in waterfall mode", default=WATERFALL_SIZE)
+    parser.add_argument("-k", dest="threshold", type=float, help="dB over the noise floor for a peak in peak mode", default=PEAK_THRESHOLD)
+    parser.add_argument("-a", dest="smoothing", type=int, help="average these many sweeps before looking for peaks", default=1)
+    parser.add_argument("-e", dest="traces", help="trace to keep over the sweeps (can be repeated), plotted or used instead of the sweeps by the other modes", choices=sorted(TRACES), action='append', default=None)
+    parser.add_argument("-T", dest="trigger", type=float, help="only write the sweeps around those with any step over this level (peak, swipe and record modes)", default=None)
+    parser.add_argument("-C", dest="calibration", help="add the corrections in this file, a [serial,]frequency,correction per line, to the amplitudes", default=None)
+    parser.add_argument("-M", dest="mask", help="like -T with a level for every frequency, read from a file with a frequency,level pair per line", default=None)
+    parser.add_argument("-B", dest="pre", type=int, help="sweeps written before the trigger", default=TRIGGER_PRE)
+    parser.add_argument("-A", dest="post", type=int, help="sweeps written after the trigger", default=TRIGGER_POST)
+    parser.add_argument("-o", dest="output", help="output format for the peak and swipe modes", choices=['csv', 'json', 'binary'], default="csv")
+    parser.add_argument("-u", dest="socket", help="write the output to this Unix socket instead of stdout", default=None)
+    parser.add_argument("-l", dest="listen", type=int, help="serve the output to any number of TCP clients on this port instead of stdout", default=None)
+    parser.add_argument("--metrics", dest="metrics", type=int, help="serve metrics in Prometheus text format on this port", default=None)
+    parser.add_argument("--profile", dest="profile", help="print the time spent in every stage and the latencies to stderr when done", action='store_true')
+    parser.add_argument("--utc", dest="utc", help="timestamps in milliseconds since the epoch (UTC) instead of since the start", action='store_true')
+    args = parser.parse_args()
+    if args.mode == "record" and args.filename == None:
+        parser.error("mode 'record' requires a file name (-w)")
+    return args
 
 #---------------------------------------------------------
 # Printer functions
@@ -60,115 +132,262 @@ Plot range of frequencies in real time
 class RFEPrinter(object):
 
     objAnalyzer = None
-    start = time.time()
+    traces = None
+    trigger = None
+    utc = False
 
     def __init__(self, objAnalyzer):
         self.objAnalyzer = objAnalyzer
+
+    def timestamp(self, fArrival = None):
+        """
+        Milliseconds since the start (or the epoch) when the sweep arrived,
+        now if not given
+        """
+        return clock.millis(clock.now() if fArrival is None else fArrival, self.utc)
     
-    def header(self):
+    def header(self, objSweep):
         None
 
-    def row(self):
+    def row(self, objSweep):
         None
 
-class PrintPeak(RFEPrinter):
+    def values(self, objSweep):
+        """
+        Amplitudes of the sweep or the first trace, if any, updated with them
+        """
+        arrAmplitudes = self.objAnalyzer.amplitudes(objSweep)
+        if self.traces:
+            return self.traces.update(arrAmplitudes)
+        return arrAmplitudes
+
+    def output(self, objSweep, arrAmplitudes, write, *args):
+        """
+        Calls write with the given arguments now or, with a trigger, only
+        if the sweep is close enough to one crossing it
+        """
+        if self.trigger is None:
+            write(*args)
+        else:
+            fired = self.trigger.crossed(arrAmplitudes, self.objAnalyzer.frequencies(objSweep))
+            self.trigger.update(fired, write, *args)
 
-    MM_SIZE = 10
-    ring = [0] * MM_SIZE
-    average = 0
-    position = 0
+    def gap(self, duration):
+        None
 
+    def flush(self):
+        None
 
-    def header(self):
-        print("timestamp,frequency,amplitude")
-    
-    def row(self):
-        nIndex = self.objAnalyzer.SweepData.Count - 1
-        objSweepTemp = self.objAnalyzer.SweepData.GetData(nIndex)
-        nStep = objSweepTemp.GetPeakStep()
-        fAmplitudeDBM = objSweepTemp.GetAmplitude_DBM(nStep)
-        fCenterFreq = objSweepTemp.GetFrequencyMHZ(nStep)
-        timestamp = int(1000 * (time.time() - self.start))
-        print("%06d,%.2f,%.1f" % (timestamp, fCenterFreq, fAmplitudeDBM))
-
-class PrintSwipe(RFEPrinter):
-
-    def header(self):
-        self.objAnalyzer.ProcessReceivedString(True)
-        nIndex = self.objAnalyzer.SweepData.Count - 1
-        objSweepTemp = self.objAnalyzer.SweepData.GetData(nIndex)
-        sResult = ""
-        for nStep in range(objSweepTemp.TotalSteps):
-            sResult += str(',{0:.2f}'.format(objSweepTemp.GetFrequencyMHZ(nStep)))
-        print("timestamp{0}".format(sResult))
-
-    def row(self):
-        nIndex = self.objAnalyzer.SweepData.Count - 1
-        objSweepTemp = self.objAnalyzer.SweepData.GetData(nIndex)
-        timestamp = int(1000 * (time.time() - startTime))
-        sResult = ""
-        for nStep in range(objSweepTemp.TotalSteps):
-            sResult += str(',{:.1f}'.format(objSweepTemp.GetAmplitudeDBM(nStep, None, False)))
-        print("{0:06d}{1}".format(timestamp, sResult))
+    def close(self):
+        None
+
+class RFESinkPrinter(RFEPrinter):
+
+    sink = None
+
+    def __init__(self, objAnalyzer, sink):
+        RFEPrinter.__init__(self, objAnalyzer)
+        self.sink = sink
+
+    def flush(self):
+        self.sink.flush()
+
+    def close(self):
+        self.sink.close()
+
+class PrintPeak(RFESinkPrinter):
+
+    detector = None
+
+    def __init__(self, objAnalyzer, sink, threshold = PEAK_THRESHOLD, smoothing = 1):
+        RFESinkPrinter.__init__(self, objAnalyzer, sink)
+        self.detector = PeakDetector(threshold = threshold, smoothing = smoothing)
+
+    def header(self, objSweep):
+        self.sink.header(["frequency", "amplitude", "floor"], [2, 1, 1])
+
+    def row(self, objSweep):
+        arrAmplitudes = self.values(objSweep)
+        arrIndexes, arrPeaks = self.detector.detect(arrAmplitudes)
+        arrFrequencies = self.objAnalyzer.frequencies(objSweep)[arrIndexes]
+        timestamp = self.timestamp(objSweep.time)
+        self.output(objSweep, arrAmplitudes, self.write, timestamp, arrFrequencies, arrPeaks, self.detector.floor)
+
+    def write(self, timestamp, arrFrequencies, arrPeaks, fFloorDBM):
+        for fCenterFreq, fAmplitudeDBM in zip(arrFrequencies.tolist(), arrPeaks.tolist()):
+            self.sink.row(timestamp, (fCenterFreq, fAmplitudeDBM, fFloorDBM))
+
+    def gap(self, duration):
+        self.sink.gap(self.timestamp(), duration)
+
+class PrintSwipe(RFESinkPrinter):
+
+    steps = 0
+
+    def header(self, objSweep):
+        self.columns(objSweep)
+
+    def columns(self, objSweep):
+        arrFrequencies = self.objAnalyzer.frequencies(objSweep)
+        self.steps = len(arrFrequencies)
+        self.sink.header(["{0:.2f}".format(fFrequency) for fFrequency in arrFrequencies])
+
+    def row(self, objSweep):
+        timestamp = self.timestamp(objSweep.time)
+        arrAmplitudes = self.values(objSweep)
+        self.output(objSweep, arrAmplitudes, self.write, timestamp, objSweep, arrAmplitudes)
+
+    def write(self, timestamp, objSweep, arrAmplitudes):
+
+        # A new header if the device changed the number of steps
+        if len(arrAmplitudes) != self.steps:
+            self.columns(objSweep)
+        self.sink.row(timestamp, arrAmplitudes.tolist())
+
+    def gap(self, duration):
+        self.sink.gap(self.timestamp(), duration)
 
 class PrintPlot(RFEPrinter):
 
+    STYLES = { 'average': 'b-', 'mean': 'g-', 'max': 'k-', 'min': 'c-', 'decay': 'm-' }
+
     y = []
     x = []
-    h = []
     peak = DBM_MIN
-    text = None
     peak_freq = 0
-    font = None
-
-    def plotter(self):
-        plt.ylim(DBM_MIN, DBM_MAX)
-        plt.grid(True)
-        plt.plot(self.x, self.h, 'k-', alpha=0.2)
-        plt.plot(self.x, self.y, 'r-')
-        plt.xlabel('frequency (MHz)', fontdict=self.font)
-        plt.ylabel('amplitude (dBm)', fontdict=self.font)
-        plt.text(self.peak_freq, self.peak+1, self.text, fontdict=self.font)
-
-    def header(self):
-        self.objAnalyzer.ProcessReceivedString(True)
-        nIndex = self.objAnalyzer.SweepData.Count - 1
-        objSweepTemp = self.objAnalyzer.SweepData.GetData(nIndex)
-        self.x = [0] * objSweepTemp.TotalSteps
-        for nStep in range(objSweepTemp.TotalSteps):
-            self.x[nStep] = objSweepTemp.GetFrequencyMHZ(nStep)
-        self.y = [DBM_MIN] * objSweepTemp.TotalSteps
-        self.h = [DBM_MIN] * objSweepTemp.TotalSteps
-        self.font = {'family': 'serif', 'color':  'darkred', 'weight': 'normal', 'size': 8 }
-        plt.ion()
-
-    def row(self):
-        nIndex = self.objAnalyzer.SweepData.Count - 1
-        objSweepTemp = self.objAnalyzer.SweepData.GetData(nIndex)
-        for nStep in range(objSweepTemp.TotalSteps):
-            value = objSweepTemp.GetAmplitudeDBM(nStep, None, False)
-            self.y[nStep] = value
-            if value > self.h[nStep]:
-                self.h[nStep] = value
-                if value > self.peak:
-                    self.peak = value
-                    self.peak_freq = objSweepTemp.GetFrequencyMHZ(nStep)
-                    self.text = "{0:.2f},{1:.1f}".format(self.peak_freq, value)
-
-        drawnow(self.plotter)
+    plot = None
+
+    def header(self, objSweep):
+        self.x = self.objAnalyzer.frequencies(objSweep)
+        self.y = np.full(objSweep.TotalSteps, DBM_MIN, dtype=np.float32)
+
+        # The sweeps are drawn over the traces, a max hold by default
+        if self.traces is None:
+            self.traces = Traces(['max'])
+
+        # Figure and artists are created once, rows only update their data
+        self.plot = LivePlot('frequency (MHz)', 'amplitude (dBm)', (DBM_MIN, DBM_MAX), PLOT_FPS)
+        self.plot.axes.set_xlim(self.x[0], self.x[-1])
+        self.overlays = [(trace, self.plot.line(self.x, self.y, self.STYLES[trace.name], alpha=0.4, label=trace.name)) for trace in self.traces]
+        self.trace = self.plot.line(self.x, self.y, 'r-', label='sweep')
+        self.label = self.plot.text(self.x[0], DBM_MIN, "")
+        self.plot.axes.legend(loc='upper right', fontsize='small')
+
+    def row(self, objSweep):
+        self.y = self.objAnalyzer.amplitudes(objSweep)
+        self.traces.update(self.y)
+        nStep = int(self.y.argmax())
+        if self.y[nStep] > self.peak:
+            self.peak = self.y[nStep]
+            self.peak_freq = self.x[nStep]
+            self.label.set_position((self.peak_freq, self.peak + 1))
+            self.label.set_text("{0:.2f},{1:.1f}".format(self.peak_freq, self.peak))
+
+        self.trace.set_ydata(self.y)
+        for trace, line in self.overlays:
+            line.set_ydata(trace.values)
+        self.plot.refresh()
+
+class PrintWaterfall(RFEPrinter):
+
+    plot = None
+
+    def __init__(self, objAnalyzer, sweeps):
+        RFEPrinter.__init__(self, objAnalyzer)
+        self.sweeps = sweeps
+
+    def header(self, objSweep):
+        x = self.objAnalyzer.frequencies(objSweep)
+
+        # Sweeps are written in place in the ring and copied newest first
+        # to the displayed image only when a frame is going to be drawn
+        self.ring = RingBuffer(self.sweeps, objSweep.TotalSteps, fill=DBM_MIN)
+        self.display = np.full((self.sweeps, objSweep.TotalSteps), DBM_MIN, dtype=np.float32)
+
+        self.plot = LivePlot('frequency (MHz)', 'sweeps ago', (self.sweeps, 0), PLOT_FPS)
+        self.image = self.plot.image(self.display, (x[0], x[-1], self.sweeps, 0), DBM_MIN, DBM_MAX)
+
+    def row(self, objSweep):
+        self.ring.append(self.values(objSweep))
+        if self.plot.due():
+            self.ring.newest(self.display)
+            self.image.set_data(self.display)
+            self.plot.refresh()
+
+class PrintRecord(RFEPrinter):
+
+    writer = None
+
+    def __init__(self, objAnalyzer, filename):
+        RFEPrinter.__init__(self, objAnalyzer)
+        self.filename = filename
+
+    def header(self, objSweep):
+        device = "RF Explorer {0}".format(self.objAnalyzer.SerialNumber)
+        self.writer = RecordingWriter(self.filename, self.objAnalyzer.frequencies(objSweep), device, start=clock.epoch)
+
+    def row(self, objSweep):
+        arrAmplitudes = self.values(objSweep)
+        self.output(objSweep, arrAmplitudes, self.writer.write, clock.elapsed(objSweep.time), arrAmplitudes)
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
+#---------------------------------------------------------
+# Output modes
+#---------------------------------------------------------
+
+# Every mode builds its printer from the arguments, plotting modes only
+# import matplotlib (see LivePlot) once they are chosen and start
+
+def mode_peak(objRFE, args):
+    return PrintPeak(objRFE, open_sink(args.output, args.socket, listen=args.listen), args.threshold, args.smoothing)
+
+def mode_swipe(objRFE, args):
+    return PrintSwipe(objRFE, open_sink(args.output, args.socket, listen=args.listen))
+
+def mode_plot(objRFE, args):
+    return PrintPlot(objRFE)
+
+def mode_waterfall(objRFE, args):
+    return PrintWaterfall(objRFE, args.sweeps)
+
+def mode_record(objRFE, args):
+    return PrintRecord(objRFE, args.filename)
+
+MODES = {
+    "peak": mode_peak,
+    "swipe": mode_swipe,
+    "plot": mode_plot,
+    "waterfall": mode_waterfall,
+    "record": mode_record,
+}
 
 #---------------------------------------------------------
 # Main processing loop
 #---------------------------------------------------------
 
+objRFE = None
+printer = None
+args = None
+
 try:
 
     # Parse arguments
     args = arguments()
 
+    # Only rows go to stdout, the messages of the library go to stderr
+    claim_stdout()
+
+    if args.metrics:
+        metrics.serve(args.metrics)
+
     # Initialize object and thread
     objRFE = RFExplorerComm()   
     objRFE.AutoConfigure = False
+    if args.calibration:
+        objRFE.calibrate(Calibration(load_tables(args.calibration)))
 
     # Frequecy span
     center = args.freq_center
@@ -185,45 +404,97 @@ try:
     # Connect
     if objRFE.connect(args.port, BAUDRATE):    
 
+        readyStart = time.time()
+
         # User requested a reset?
-        if args.reset:
-            objRFE.reset()
-        
+        if args.reset and not objRFE.reset(RESET_TIMEOUT):
+            print("Error: RF Explorer did not report the reset")
+
         # Request RF Explorer configuration
-        objRFE.init()
+        elif not objRFE.init(INIT_TIMEOUT):
+            print("Error: RF Explorer did not send its configuration")
 
         # If object is an analyzer, we can scan for received sweeps
-        if (objRFE.IsAnalyzer()):     
+        elif (objRFE.IsAnalyzer()):     
 
-            # Define frequency span
-            objRFE.range(center, span)
+            print("Ready in {0:.2f}s".format(time.time() - readyStart), file=sys.stderr)
+
+            # Define frequency span, ranges wider than the device can
+            # sweep at once are scanned in segments
+            scanner = None
+            if span > objRFE.MaxSpanMHZ:
+                scanner = Scanner(objRFE, center - span / 2, center + span / 2, SCAN_DWELL, SCAN_SETTLE)
+                scanner.begin()
+            else:
+                objRFE.range(center, span)
 
             # Get mode printer
-            printer = None
-            if args.mode == "peak":
-                printer = PrintPeak(objRFE)
-            if args.mode == "swipe":
-                printer = PrintSwipe(objRFE)
-            if args.mode == "plot":
-                printer = PrintPlot(objRFE)
-            if printer == None:
-                print("Invalid mode '{0}'".format(args.mode))
-                sys.exit(1)
-            printer.header()
-            
+            printer = MODES[args.mode](objRFE, args)
+            printer.utc = args.utc
+            if args.traces:
+                printer.traces = Traces(args.traces)
+            if args.mask:
+                printer.trigger = Trigger(args.pre, args.post, mask=load_mask(args.mask))
+            elif args.trigger is not None:
+                printer.trigger = Trigger(args.pre, args.post, level=args.trigger)
+
+            # Wait for the first sweep (or the first pass)
+            firstStart = time.time()
+            sweeps = []
+            while (len(sweeps) == 0):
+                if (time.time() - firstStart) > STALL_TIMEOUT * (len(scanner.segments) if scanner else 1):
+                    raise TimeoutError("RF Explorer is not sending sweeps")
+                objRFE.wait(WAIT_TIMEOUT)
+                if scanner:
+                    sweeps = scanner.update()
+                elif objRFE.history.count > 0:
+                    sweeps = [objRFE.history.latest()]
+            printer.header(sweeps[-1])
+            print("First sweep in {0:.2f}s".format(time.time() - readyStart), file=sys.stderr)
+
             # Process until we complete scan time
             last = 0
+            lost = None
             startTime = time.time()
+            if scanner:
+                printer.row(sweeps[-1])
 
             while ((args.duration == 0) or ((time.time() - startTime) < args.duration)):    
 
-                # Process all received data from device 
-                objRFE.ProcessReceivedString(True)
-
-                # Print data if received new sweep only
-                if (objRFE.SweepData.Count > last):
-                    last = objRFE.SweepData.Count
-                    printer.row()
+                # Sleep until the device sends new data
+                if not objRFE.wait(WAIT_TIMEOUT):
+
+                    # Do not hold batched rows while idle
+                    printer.flush()
+
+                    # Device unplugged or silent, find it again and resume
+                    if not objRFE.alive(STALL_TIMEOUT):
+                        lost = lost or objRFE.m_fLastSweepTime
+                        print("Device lost, reconnecting...", file=sys.stderr)
+                        if objRFE.reconnect(RECONNECT_TIMEOUT):
+                            print("Reconnected, {0:.1f}s without data".format(time.time() - lost), file=sys.stderr)
+                            printer.gap(time.time() - lost)
+                            lost = None
+                            if scanner:
+                                scanner.begin()
+                    continue
+
+                # Every stitched sweep of a scan or every new sweep
+                if scanner:
+                    sweeps = scanner.update()
+                else:
+                    sweeps = objRFE.history.since(last)
+                    last = objRFE.history.count
+
+                start = time.perf_counter()
+                for objSweep in sweeps:
+                    printer.row(objSweep)
+                    metrics.latency("emitted", clock.now() - objSweep.time)
+                if sweeps:
+                    metrics.observe("process", time.perf_counter() - start)
+
+            if scanner:
+                print("Scan: " + scanner.report(), file=sys.stderr)
 
         else:
             print("Error: Device connected is a Signal Generator. \nPlease, connect a Spectrum Analyzer")
@@ -241,5 +512,17 @@ except Exception as obEx:
 # Close object and release resources
 #---------------------------------------------------------
 
-objRFE.Close()    #Finish the thread and close port
-objRFE = None 
+try:
+    if printer:
+        printer.close()
+        if printer.trigger:
+            print("Trigger: " + printer.trigger.report(), file=sys.stderr)
+
+finally:
+    if objRFE:
+        objRFE.Close()    #Finish the thread and close port
+    objRFE = None
+
+if args and args.profile:
+    print(metrics.profile(), file=sys.stderr)
+metrics.close() 
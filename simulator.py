@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import argparse
+import textwrap
+
+from lib.Simulator import RFExplorerSimulator, PM8000Simulator
+from lib.Recording import RecordingReader
+
+#---------------------------------------------------------
+# Configuration
+#---------------------------------------------------------
+
+DURATION = 0
+RFEXPLORER_STEPS = 112
+RFEXPLORER_RATE = 10
+PM8000_RATE = 8
+FREQ_CENTER = 866.5
+FREQ_SPAN = 7.0
+
+#---------------------------------------------------------
+# Command line arguments
+#---------------------------------------------------------
+
+def arguments():
+
+    epilog = """
+Usage examples:
+
+Simulate an RF Explorer sending 1024 step sweeps 50 times per second
+    python {0} -m rfexplorer -n 1024 -r 50
+
+Simulate a Power Monitor 8000 and read it
+    python {0} -m pm8000
+    python pm8000.py -p /dev/pts/3
+
+Replay a recording from rfexplorer.py or pm8000.py 10 times faster, over and over
+    python {0} -m replay -i capture.rftr -x 10 -l
+
+(c) 2019-2024 Xose Pérez (@xoseperez)""".format(sys.argv[0])
+
+    # Parse command line options
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, epilog=textwrap.dedent(epilog))
+    parser.add_argument("-m", dest="mode", help="device to simulate", choices=['rfexplorer', 'pm8000', 'replay'], default="rfexplorer")
+    parser.add_argument("-n", dest="steps", type=int, help="RF Explorer steps per sweep", default=RFEXPLORER_STEPS)
+    parser.add_argument("-r", dest="rate", type=float, help="sweeps or frames per second", default=None)
+    parser.add_argument("-c", dest="freq_center", type=float, help="RF Explorer initial frequency center", default=FREQ_CENTER)
+    parser.add_argument("-s", dest="freq_span", type=float, help="RF Explorer initial frequency span", default=FREQ_SPAN)
+    parser.add_argument("-i", dest="filename", help="recording file for the replay mode", default=None)
+    parser.add_argument("-x", dest="speed", type=float, help="replay speed (2 for twice as fast)", default=1.0)
+    parser.add_argument("-l", dest="loop", help="replay the recording over and over", action='store_true')
+    parser.add_argument("-d", dest="duration", type=int, help="simulate for these many seconds (0 for non-stop)", default=DURATION)
+    return parser.parse_args()
+
+#---------------------------------------------------------
+# Main
+#---------------------------------------------------------
+
+simulator = None
+
+try:
+
+    # Parse arguments
+    args = arguments()
+
+    if args.mode == "rfexplorer":
+        simulator = RFExplorerSimulator(args.steps, args.rate or RFEXPLORER_RATE, args.freq_center, args.freq_span)
+    if args.mode == "pm8000":
+        simulator = PM8000Simulator(args.rate or PM8000_RATE)
+    if args.mode == "replay":
+        if args.filename == None:
+            print("Mode 'replay' requires a file name (-i)")
+            sys.exit(1)
+
+        # Single frequency recordings come from pm8000.py
+        reader = RecordingReader(args.filename)
+        if reader.steps == 1:
+            simulator = PM8000Simulator(PM8000_RATE, reader=reader, speed=args.speed, loop=args.loop)
+        else:
+            simulator = RFExplorerSimulator(reader=reader, speed=args.speed, loop=args.loop)
+
+    simulator.start()
+    print("{0} simulator on {1}".format("RF Explorer" if isinstance(simulator, RFExplorerSimulator) else "Power Monitor 8000", simulator.port))
+
+    # Run until the time is over or the recording has been replayed
+    startTime = time.time()
+    while ((args.duration == 0) or ((time.time() - startTime) < args.duration)) and simulator.is_alive():
+        simulator.join(1)
+
+    print("Sent {0} messages".format(simulator.sent))
+
+except KeyboardInterrupt:
+    None
+
+except Exception as obEx:
+    print("Error: " + str(obEx))
+
+#---------------------------------------------------------
+# Release resources
+#---------------------------------------------------------
+
+if simulator:
+    simulator.close()